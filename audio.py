@@ -0,0 +1,118 @@
+import io
+import time
+import numpy as np
+import pygame
+from storage import atomic_write
+
+# Bump when a sound below changes so stale caches are rebuilt.
+SYNTH_VERSION = 1
+
+# name: (voices, minimum seconds between two starts)
+CATEGORIES = {
+    "hit": (3, 0.04),
+    "wall": (2, 0.06),
+    "powerup": (1, 0.1),
+    "score": (1, 0.2),
+    "win": (1, 0.0),
+}
+
+
+def _tone(rate, freq, seconds, decay=8.0, volume=0.5):
+    # Sine with a little odd harmonic for bite, and an exponential decay.
+    t = np.arange(int(rate * seconds)) / rate
+    phase = 2 * np.pi * np.cumsum(np.broadcast_to(np.asarray(freq, dtype=float), t.shape)) / rate
+    wave = np.sin(phase) + 0.25 * np.sin(3 * phase)
+    envelope = np.exp(-decay * t) * np.minimum(1.0, t * rate / 64)
+    return volume * wave * envelope / 1.25
+
+
+def synthesize(rate):
+    sweep = lambda a, b, s: np.linspace(a, b, int(rate * s))
+    sounds = {
+        "hit": _tone(rate, 660, 0.07, decay=40),
+        "wall": _tone(rate, 330, 0.05, decay=50, volume=0.35),
+        "powerup": _tone(rate, sweep(500, 1300, 0.18), 0.18, decay=10),
+        "score": np.concatenate([_tone(rate, 440, 0.12, decay=12), _tone(rate, 294, 0.22, decay=10)]),
+        "win": np.concatenate([_tone(rate, f, 0.16, decay=6) for f in (523, 659, 784)]
+                              + [_tone(rate, 1047, 0.5, decay=4)]),
+    }
+    return {name: np.clip(wave * 32767, -32768, 32767).astype(np.int16) for name, wave in sounds.items()}
+
+
+def load_sounds(rate, cache_path=None):
+    # Synthesising is cheap but not free; the samples are cached on disk per
+    # mixer rate and SYNTH_VERSION.
+    if cache_path:
+        try:
+            with np.load(cache_path) as cached:
+                if int(cached["version"]) == SYNTH_VERSION and int(cached["rate"]) == rate:
+                    return {name: cached[name] for name in CATEGORIES}
+        except (OSError, KeyError, ValueError):
+            pass
+    sounds = synthesize(rate)
+    if cache_path:
+        buffer = io.BytesIO()
+        np.savez(buffer, version=SYNTH_VERSION, rate=rate, **sounds)
+        try:
+            atomic_write(cache_path, buffer.getvalue())
+        except OSError:
+            pass
+    return sounds
+
+
+def _to_mixer_format(samples, size, channels):
+    if size == 32:
+        data = samples.astype(np.float32) / 32768
+    elif abs(size) == 8:
+        data = (samples >> 8).astype(np.int8)
+        if size > 0:
+            data = (data.astype(np.int16) + 128).astype(np.uint8)
+    elif size > 0:
+        data = (samples.astype(np.int32) + 32768).astype(np.uint16)
+    else:
+        data = samples
+    if channels > 1:
+        data = np.repeat(data[:, None], channels, axis=1)
+    return np.ascontiguousarray(data)
+
+
+class SoundBank:
+    # Every category owns a fixed set of reserved mixer channels. A sound that
+    # comes sooner than its category's interval after the previous one, or
+    # finds all of its voices busy, is dropped rather than queued, so a burst
+    # of events costs at most a few cheap checks per frame.
+    def __init__(self, cache_path=None):
+        rate, size, channels = pygame.mixer.get_init()
+        samples = load_sounds(rate, cache_path)
+        self.sounds = {name: pygame.sndarray.make_sound(_to_mixer_format(samples[name], size, channels))
+                       for name in CATEGORIES}
+        total = sum(voices for voices, _ in CATEGORIES.values())
+        pygame.mixer.set_num_channels(max(total, pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(total)
+        self.channels = {}
+        first = 0
+        for name, (voices, _) in CATEGORIES.items():
+            self.channels[name] = [pygame.mixer.Channel(i) for i in range(first, first + voices)]
+            first += voices
+        self.last = dict.fromkeys(CATEGORIES, float("-inf"))
+        self.played = 0
+        self.dropped = 0
+
+    def play(self, name, now=None):
+        now = time.perf_counter() if now is None else now
+        if now - self.last[name] < CATEGORIES[name][1]:
+            self.dropped += 1
+            return False
+        for channel in self.channels[name]:
+            if not channel.get_busy():
+                channel.play(self.sounds[name])
+                self.last[name] = now
+                self.played += 1
+                return True
+        self.dropped += 1
+        return False
+
+    def stop(self):
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.stop()
@@ -0,0 +1,279 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import atexit
+import json
+import platform
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pygame
+import broadcast
+import pong
+from capture import VideoRecorder
+
+
+def track_ball(game):
+    # Scripted left player: follows the first ball so rallies keep going.
+    sim = game.sim
+    b = sim.first_ball()[0]
+    target = sim.ball_y[0, b] + sim.ball_size[0, b] / 2
+    center = sim.paddle_y[0, 0] + sim.paddle_h[0, 0] / 2
+    game.actions = [(int(np.sign(target - center)) if abs(target - center) > 10 else 0, 0)]
+
+
+def game_frame(game):
+    track_ball(game)
+    game.update_game()
+    game.draw_game()
+    game.present()
+
+
+def start_match(game):
+    game.mode = "PvAI"
+    game.state = "game"
+    game.reset_game()
+
+
+def idle_menu(game):
+    game.state = "menu"
+    game.menu_fade_in = True
+    game.menu_alpha = 0
+
+    def frame():
+        game.draw_main_menu(0)
+        game.present()
+    return frame
+
+
+def rally(game):
+    start_match(game)
+    return lambda: game_frame(game)
+
+
+def rally_4k(game):
+    # Same drawing work as rally; only the final scale to the window grows.
+    game.resize_window((3840, 2160))
+    start_match(game)
+    return lambda: game_frame(game)
+
+
+def multiball(game):
+    start_match(game)
+    game.sim.powerup_chance = 0.05
+    game.sim.reset()  # so the first spawn is drawn at the new rate
+    return lambda: game_frame(game)
+
+
+def chaos(game):
+    game.mode = "Chaos"
+    game.state = "game"
+    game.reset_game()
+    return lambda: game_frame(game)
+
+
+def chaos_512(game):
+    # Chaos with 512 balls in play from the first frame.
+    frame = chaos(game)
+    game.sim.start_balls = 512
+    game.sim.reset()
+    return frame
+
+
+def chaos_broadcast(game):
+    # Chaos mode streamed to 60 spectators; compare its frame time with chaos.
+    game.broadcaster = broadcast.Broadcaster(0)
+    address = ("127.0.0.1", game.broadcaster.sock.getsockname()[1])
+    viewers = []
+    for _ in range(60):
+        viewer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        viewer.bind(("127.0.0.1", 0))
+        viewer.sendto(broadcast.SUBSCRIBE, address)
+        viewers.append(viewer)
+    game.viewers = viewers
+    return chaos(game)
+
+
+def chaos_governed(game):
+    # Chaos with the quality governor fed each frame's time, as the game loop does.
+    frame = chaos(game)
+
+    def governed():
+        t0 = time.perf_counter()
+        frame()
+        game.governor.frame(time.perf_counter() - t0)
+    return governed
+
+
+def chaos_capture(game):
+    # Chaos while recording PNG frames; compare its frame time with chaos.
+    folder = tempfile.TemporaryDirectory()
+    game.video = VideoRecorder(folder.name, game.screen)
+    atexit.register(folder.cleanup)
+    atexit.register(game.video.close)
+    frame = chaos(game)
+
+    def captured():
+        frame()
+        game.video.capture(game.screen)
+    return captured
+
+
+def particle_storm(game):
+    start_match(game)
+    rng = np.random.default_rng(0)
+
+    def frame():
+        for x, y in rng.uniform((0, 0), (pong.WIDTH, pong.HEIGHT), (10, 2)):
+            game.create_particles((x, y))
+        game_frame(game)
+    return frame
+
+
+def winner_confetti(game):
+    game.state = "winner"
+    game.winner = "Left"
+    frames = [0]
+
+    def frame():
+        if frames[0] % 20 == 0:
+            game.create_confetti((pong.WIDTH//2, pong.HEIGHT//2-40))
+        frames[0] += 1
+        game.confetti.update()
+        game.draw_winner()
+        game.present()
+    return frame
+
+
+SCENARIOS = {
+    "idle_menu": idle_menu,
+    "rally": rally,
+    "rally_4k": rally_4k,
+    "multiball": multiball,
+    "chaos": chaos,
+    "chaos_512": chaos_512,
+    "chaos_broadcast": chaos_broadcast,
+    "chaos_governed": chaos_governed,
+    "chaos_capture": chaos_capture,
+    "particle_storm": particle_storm,
+    "winner_confetti": winner_confetti,
+}
+
+
+def make_game(seed, full_redraw=False):
+    game = pong.PongGame(seed=seed, full_redraw=full_redraw)
+    game.sound_on = False
+    return game
+
+
+def run_scenario(name, frames, seed, warmup=30, full_redraw=False):
+    game = make_game(seed, full_redraw)
+    frame = SCENARIOS[name](game)
+    for _ in range(warmup):
+        frame()
+    pixels = game.dirty.total_pixels
+    times = np.empty(frames)
+    start = time.perf_counter()
+    for i in range(frames):
+        t0 = time.perf_counter()
+        frame()
+        times[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - start
+    pixels = (game.dirty.total_pixels - pixels) / frames
+
+    # Memory is measured in a second pass so tracemalloc does not skew timings.
+    frame = SCENARIOS[name](make_game(seed, full_redraw))
+    tracemalloc.start()
+    for _ in range(warmup + frames):
+        frame()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    return {
+        "frames": frames,
+        "p50_ms": round(p50, 4),
+        "p95_ms": round(p95, 4),
+        "p99_ms": round(p99, 4),
+        "mean_ms": round(times.mean() * 1000, 4),
+        "fps": round(frames / elapsed, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "pixels_per_frame": round(pixels),
+        "caches": game.cache_report(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]:.3f} -> {result[key]:.3f}")
+        if result["fps"] < base["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: fps {base['fps']:.1f} -> {result['fps']:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Ultimate Pong benchmarks")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="fail if results regress against this file")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="push the whole window every frame, to compare with dirty rects")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    with tempfile.TemporaryDirectory() as tmp:
+        pong.CONFIG_FILE = os.path.join(tmp, "pong_settings.json")
+        pong.HISTORY_FILE = os.path.join(tmp, "pong_history.jsonl")
+        pong.STATS_FILE = os.path.join(tmp, "pong_stats.json")
+        pong.FONT_CACHE_FILE = os.path.join(tmp, "pong_fonts.json")
+        pong.SOUND_CACHE_FILE = os.path.join(tmp, "pong_sounds.npz")
+        results = {
+            "meta": {
+                "python": platform.python_version(),
+                "pygame": pygame.version.ver,
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "seed": args.seed,
+                "full_redraw": args.full_redraw,
+            },
+            "scenarios": {},
+        }
+        for name in args.scenario or SCENARIOS:
+            result = results["scenarios"][name] = run_scenario(name, args.frames, args.seed,
+                                                               full_redraw=args.full_redraw)
+            print(f"{name:16} p50 {result['p50_ms']:7.3f}ms  p95 {result['p95_ms']:7.3f}ms  "
+                  f"p99 {result['p99_ms']:7.3f}ms  {result['fps']:8.1f} fps  peak {result['peak_kib']:8.1f} KiB  "
+                  f"{result['pixels_per_frame'] / 1000:6.0f}k px")
+    pygame.quit()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
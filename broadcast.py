@@ -0,0 +1,288 @@
+import asyncio
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from runner import Frame, FrameQueue
+from sim import POWERUP_TYPES
+
+KEYFRAME_INTERVAL = 60
+POS_SCALE = 4           # positions are sent in quarter pixels
+VIEWER_TIMEOUT = 5.0    # viewers re-subscribe every KEEPALIVE seconds
+KEEPALIVE = 1.0
+DELTA_MAX = np.iinfo(np.int16).max
+JUMP = 80               # a ball moving further than this in a tick was served, not moved
+
+KEYFRAME, DELTA, SUBSCRIBE, UNSUBSCRIBE = b"K", b"D", b"S", b"U"
+# kind, match number, tick, keyframe tick, event count
+HEADER = struct.Struct("<cHIIH")
+# kind, x, y, side, power-up kind, colour
+EVENT = struct.Struct("<BhhbbBBB")
+EVENT_KINDS = ["hit", "wall", "powerup", "score"]
+INFO_SIZE = struct.Struct("<H")
+
+
+def pack_state(view):
+    # Match 0 of a Simulation or Frame as one int32 vector. Empty ball,
+    # power-up and effect slots are zeroed so they cost nothing once compressed.
+    q = lambda a: np.round(a * POS_SCALE).astype(np.int32).ravel()
+    alive, pu_alive, fx_alive = view.ball_alive[0], view.pu_alive[0], view.fx_alive[0]
+    return np.concatenate([
+        np.array([view.tick[0]], dtype=np.int32), view.score[0].astype(np.int32),
+        q(view.paddle_y[0]), q(view.paddle_h[0]), alive.astype(np.int32),
+        q(np.where(alive, view.ball_x[0], 0)), q(np.where(alive, view.ball_y[0], 0)),
+        q(np.where(alive, view.ball_size[0], 0)), pu_alive.astype(np.int32),
+        q(np.where(pu_alive, view.pu_x[0], 0)), q(np.where(pu_alive, view.pu_y[0], 0)),
+        np.where(pu_alive, view.pu_kind[0], 0).astype(np.int32),
+        fx_alive.astype(np.int32), np.where(fx_alive, view.fx_kind[0], 0).astype(np.int32),
+        np.where(fx_alive, view.fx_side[0], 0).astype(np.int32),
+        np.where(fx_alive, view.fx_until[0], 0).astype(np.int32),
+    ])
+
+
+def pack_events(events):
+    out = []
+    for kind, n, (x, y), data in events:
+        if n != 0:
+            continue
+        side, pu, color = -1, -1, (0, 0, 0)
+        if kind == "powerup":
+            pu, color = POWERUP_TYPES.index(data[0]), data[1]
+        elif data is not None:
+            side = data
+        out.append(EVENT.pack(EVENT_KINDS.index(kind), int(x * POS_SCALE), int(y * POS_SCALE), side, pu, *color))
+    return len(out), b"".join(out)
+
+
+def unpack_events(data, offset, count):
+    events = []
+    for kind, x, y, side, pu, r, g, b in EVENT.iter_unpack(data[offset:offset + count * EVENT.size]):
+        kind = EVENT_KINDS[kind]
+        data = (POWERUP_TYPES[pu], (r, g, b)) if kind == "powerup" else None if side < 0 else side
+        events.append((kind, 0, (x / POS_SCALE, y / POS_SCALE), data))
+    return events
+
+
+class Broadcaster:
+    # Streams match 0 of the game to any number of spectators over UDP. The
+    # frame loop only packs each tick into a vector and queues it; encoding
+    # and the sends to every viewer happen on a background thread. Every tick
+    # is coded against the latest keyframe, not the tick before, so a lost
+    # datagram costs one tick and a new viewer starts from the keyframe.
+    def __init__(self, port, keyframe_interval=KEYFRAME_INTERVAL):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("0.0.0.0", port))
+        self.sock.setblocking(False)
+        self.keyframe_interval = keyframe_interval
+        self.queue = queue.SimpleQueue()
+        self.viewers = {}
+        self.match = 0
+        self.last_tick = -1
+        self.key = None
+        self.key_tick = 0
+        self.keyframe = None
+        self.sent = 0
+        self.keyframes = 0
+        self.messages = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name="broadcast")
+        self.thread.start()
+
+    def publish(self, view, win_score):
+        info = (view.width, view.height, win_score, view.ball_alive.shape[1], view.pu_alive.shape[1],
+                view.fx_alive.shape[1])
+        self.queue.put((pack_state(view), view.events, info))
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.sock.close()
+
+    def _run(self):
+        while not self.closed:
+            self._poll()
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            message = self._encode(*item) if item is not None else None
+            if message is not None:
+                self._send(message, self.viewers)
+
+    def _poll(self):
+        now = time.perf_counter()
+        while True:
+            try:
+                data, address = self.sock.recvfrom(16)
+            except OSError:
+                break
+            if data == SUBSCRIBE:
+                if address not in self.viewers and self.keyframe:
+                    self._send(self.keyframe, [address])
+                self.viewers[address] = now
+            elif data == UNSUBSCRIBE:
+                self.viewers.pop(address, None)
+        for address in [a for a, heard in self.viewers.items() if now - heard > VIEWER_TIMEOUT]:
+            del self.viewers[address]
+
+    def _encode(self, vec, events, info):
+        tick = int(vec[0])
+        if tick == self.last_tick:
+            return None  # a finished match is not stepping any more
+        new_match = tick < self.last_tick
+        if new_match:
+            self.match = (self.match + 1) & 0xFFFF
+        self.last_tick = tick
+        count, packed = pack_events(events)
+        # Deltas go out as int16, half the bytes of the state itself; one too
+        # large for that (a long-lived effect's expiry tick) forces a keyframe.
+        delta = vec - self.key if self.key is not None and len(vec) == len(self.key) else None
+        if (delta is None or new_match or tick - self.key_tick >= self.keyframe_interval
+                or np.abs(delta).max() > DELTA_MAX):
+            self.key, self.key_tick = vec, tick
+            names = ["width", "height", "win_score", "balls", "powerups", "effects"]
+            info = json.dumps(dict(zip(names, info))).encode()
+            self.keyframe = (HEADER.pack(KEYFRAME, self.match, tick, tick, count) + packed
+                             + INFO_SIZE.pack(len(info)) + info + zlib.compress(vec.tobytes(), 1))
+            self.keyframes += 1
+            return self.keyframe
+        return (HEADER.pack(DELTA, self.match, tick, self.key_tick, count) + packed
+                + zlib.compress(delta.astype(np.int16).tobytes(), 1))
+
+    def _send(self, message, addresses):
+        self.messages += 1
+        for address in list(addresses):
+            try:
+                self.sock.sendto(message, address)
+                self.sent += len(message)
+            except OSError:
+                pass  # a full buffer or a vanished viewer; the next tick will do
+
+
+class WorldState:
+    # What a spectator knows of the match, in the same arrays (for a batch of
+    # one) that a Frame copies out of a Simulation.
+    def __init__(self, info):
+        b, p, e = info["balls"], info["powerups"], info["effects"]
+        self.width, self.height = info["width"], info["height"]
+        self.win_score = info["win_score"]
+        self.sizes = [1, 2, 2, 2, b, b, b, b, p, p, p, p, e, e, e, e]
+        self.tick = np.zeros(1, dtype=np.int64)
+        self.score = np.zeros((1, 2), dtype=np.int64)
+        self.paddle_y = np.zeros((1, 2))
+        self.paddle_h = np.zeros((1, 2))
+        self.ball_alive = np.zeros((1, b), dtype=bool)
+        self.ball_x, self.ball_y, self.ball_size = np.zeros((3, 1, b))
+        self.pu_alive = np.zeros((1, p), dtype=bool)
+        self.pu_x, self.pu_y = np.zeros((2, 1, p))
+        self.pu_kind = np.zeros((1, p), dtype=np.int64)
+        self.fx_alive = np.zeros((1, e), dtype=bool)
+        self.fx_kind, self.fx_side = np.zeros((2, 1, e), dtype=np.int64)
+        self.fx_until = np.zeros((1, e), dtype=np.uint64)
+        self.prev_paddle_y = self.paddle_y.copy()
+        self.prev_ball_x = self.ball_x.copy()
+        self.prev_ball_y = self.ball_y.copy()
+        self.events = []
+
+    def load(self, vec, events):
+        self.prev_paddle_y[:] = self.paddle_y
+        was_alive = self.ball_alive.copy()
+        self.prev_ball_x[:], self.prev_ball_y[:] = self.ball_x, self.ball_y
+        (tick, score, paddle_y, paddle_h, alive, x, y, size, pu_alive, pu_x, pu_y, pu_kind,
+         fx_alive, fx_kind, fx_side, fx_until) = np.split(vec, np.cumsum(self.sizes)[:-1])
+        self.tick[0] = tick[0]
+        self.score[0] = score
+        self.paddle_y[0] = paddle_y / POS_SCALE
+        self.paddle_h[0] = paddle_h / POS_SCALE
+        self.ball_alive[0] = alive
+        self.ball_x[0], self.ball_y[0], self.ball_size[0] = x / POS_SCALE, y / POS_SCALE, size / POS_SCALE
+        self.pu_alive[0] = pu_alive
+        self.pu_x[0], self.pu_y[0] = pu_x / POS_SCALE, pu_y / POS_SCALE
+        self.pu_kind[0] = pu_kind
+        self.fx_alive[0], self.fx_kind[0], self.fx_side[0], self.fx_until[0] = fx_alive, fx_kind, fx_side, fx_until
+        # Served or respawned balls appear where they are rather than sliding there.
+        jumped = ~was_alive | (np.abs(self.ball_x - self.prev_ball_x) + np.abs(self.ball_y - self.prev_ball_y) > JUMP)
+        self.prev_ball_x[jumped], self.prev_ball_y[jumped] = self.ball_x[jumped], self.ball_y[jumped]
+        self.events = events
+
+
+class Spectator(asyncio.DatagramProtocol):
+    # Receives a broadcast and turns each tick into a Frame, ready for the
+    # same drawing code the game uses.
+    def __init__(self, address):
+        self.address = address
+        self.loop = asyncio.get_running_loop()
+        self.frames = FrameQueue()
+        self.transport = None
+        self.world = None
+        self.info = None
+        self.key = None
+        self.key_id = None
+        self.last = None
+        self.received = 0
+        self.skipped = 0
+        self.keepalive = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        pass  # the host is not up yet; keep subscribing
+
+    def datagram_received(self, data, address):
+        self.received += len(data)
+        frame = self.decode(data)
+        if frame is not None:
+            self.frames.put(frame)
+
+    def decode(self, data):
+        kind, match, tick, key_tick, count = HEADER.unpack_from(data)
+        stale = self.last is not None and self.last[0] == match and tick <= self.last[1]
+        offset = HEADER.size + count * EVENT.size
+        if kind == KEYFRAME:
+            (size,) = INFO_SIZE.unpack_from(data, offset)
+            offset += INFO_SIZE.size
+            info = json.loads(data[offset:offset + size])
+            # A restarted host numbers its matches from 0 again: a keyframe
+            # further back, or for another court, starts a new match.
+            restart = info != self.info or (stale and tick < self.last[1])
+            if stale and not restart:
+                return None  # repeated
+            vec = np.frombuffer(zlib.decompress(data[offset + size:]), dtype=np.int32)
+            if restart:
+                self.world, self.info = WorldState(info), info
+            self.key, self.key_id = vec, (match, tick)
+        elif stale:
+            return None  # late or repeated
+        elif self.key_id == (match, key_tick):
+            vec = self.key + np.frombuffer(zlib.decompress(data[offset:]), dtype=np.int16)
+        else:
+            self.skipped += 1  # its keyframe was lost; wait for the next one
+            return None
+        self.last = (match, tick)
+        self.world.load(vec, unpack_events(data, HEADER.size, count))
+        return Frame(self.world, 0, time.perf_counter())
+
+    async def _keepalive(self):
+        while True:
+            self.transport.sendto(SUBSCRIBE, self.address)
+            await asyncio.sleep(KEEPALIVE)
+
+    def close(self):
+        self.keepalive.cancel()
+        self.transport.sendto(UNSUBSCRIBE, self.address)
+        self.transport.close()
+
+
+async def watch(address):
+    loop = asyncio.get_running_loop()
+    info = await loop.getaddrinfo(*address, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    spectator = Spectator(info[0][4])
+    await loop.create_datagram_endpoint(lambda: spectator, local_addr=("0.0.0.0", 0))
+    spectator.keepalive = loop.create_task(spectator._keepalive())
+    return spectator
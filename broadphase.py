@@ -0,0 +1,55 @@
+import numpy as np
+
+NEIGHBOURS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+
+def _expand(starts, ends):
+    # Flattens the index ranges [starts[i], ends[i]) into (owner, index) pairs.
+    counts = ends - starts
+    owner = np.repeat(np.arange(len(starts)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + np.arange(len(owner)) - first
+
+
+class SpatialHash:
+    # Uniform grid over every match in a batch. An item is filed under the
+    # cell holding its centre, so with a cell at least as large as any item
+    # plus its per-substep motion, overlapping items always share a cell or
+    # sit in neighbouring ones.
+    def __init__(self, cell, width, height):
+        self.cell = cell
+        self.cols = int(width // cell) + 3
+        self.rows = int(height // cell) + 3
+        self.per_match = self.cols * self.rows
+
+    def cells(self, x, y):
+        cx = np.clip((np.asarray(x) // self.cell).astype(np.int64) + 1, 0, self.cols - 1)
+        cy = np.clip((np.asarray(y) // self.cell).astype(np.int64) + 1, 0, self.rows - 1)
+        return cx, cy
+
+    def keys(self, match, x, y):
+        cx, cy = self.cells(x, y)
+        return match * self.per_match + cy * self.cols + cx
+
+    def pairs(self, keys_a, keys_b, same=False):
+        # Candidate (a, b) index pairs whose cells touch. With same=True the
+        # two key sets are one and each unordered pair is reported once.
+        order = np.argsort(keys_b, kind="stable")
+        sorted_b = keys_b[order]
+        owners, others = [], []
+        for dx, dy in NEIGHBOURS:
+            k = keys_a + dy * self.cols + dx
+            a, pos = _expand(np.searchsorted(sorted_b, k, "left"), np.searchsorted(sorted_b, k, "right"))
+            owners.append(a)
+            others.append(order[pos])
+        a, b = np.concatenate(owners), np.concatenate(others)
+        keep = keys_a[a] // self.per_match == keys_b[b] // self.per_match
+        if same:
+            keep &= a < b
+        return a[keep], b[keep]
+
+    def near_rect(self, cx, cy, x0, y0, x1, y1):
+        # Items whose cell touches the cells covered by the rect (x0, y0)-(x1, y1).
+        lo_x, lo_y = self.cells(x0, y0)
+        hi_x, hi_y = self.cells(x1, y1)
+        return (cx >= lo_x - 1) & (cx <= hi_x + 1) & (cy >= lo_y - 1) & (cy <= hi_y + 1)
@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+import numpy as np
+
+SLOTS = 8
+# head (frames written), tail (frames encoded), closing flag
+HEAD, TAIL, CLOSING = range(3)
+
+
+def _shared_size(slots, frame_bytes):
+    return 4 * 8 + slots * 8 + 8 + slots * frame_bytes
+
+
+def _layout(slots, frame_bytes, buf):
+    # Control counters, per-slot frame number, total encode time, then the frames.
+    ctrl = np.ndarray(4, dtype=np.int64, buffer=buf)
+    seqs = np.ndarray(slots, dtype=np.int64, buffer=buf, offset=ctrl.nbytes)
+    encode_s = np.ndarray(1, dtype=np.float64, buffer=buf, offset=ctrl.nbytes + seqs.nbytes)
+    offset = ctrl.nbytes + seqs.nbytes + encode_s.nbytes
+    frames = np.ndarray((slots, frame_bytes), dtype=np.uint8, buffer=buf, offset=offset)
+    return ctrl, seqs, encode_s, frames
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png_bytes(rgb, level=1):
+    h, w, _ = rgb.shape
+    rows = np.zeros((h, 1 + 3 * w), dtype=np.uint8)  # filter byte 0 on every row
+    rows[:, 1:] = rgb.reshape(h, -1)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) + _png_chunk(b"IEND", b""))
+
+
+class PngSequence:
+    # One PNG per frame, named by frame number, so dropped frames show up as gaps.
+    def __init__(self, path, size, fps):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, seq, rgb):
+        with open(os.path.join(self.path, f"frame-{seq:06d}.png"), "wb") as f:
+            f.write(png_bytes(rgb))
+
+    def close(self):
+        pass
+
+
+class Y4mVideo:
+    # Raw YUV 4:2:0 video that ffmpeg, mpv and VLC play directly. A dropped
+    # frame repeats the one before it, so the video keeps the match's timing.
+    def __init__(self, path, size, fps):
+        self.w, self.h = size[0] & ~1, size[1] & ~1
+        self.file = open(path, "wb")
+        self.file.write(f"YUV4MPEG2 W{self.w} H{self.h} F{fps}:1 Ip A1:1 C420jpeg\n".encode())
+        self.last = None
+        self.next_seq = 0
+
+    def write(self, seq, rgb):
+        r, g, b = (rgb[:self.h, :self.w, i].astype(np.float32) for i in range(3))
+        y = 0.299 * r + 0.587 * g + 0.114 * b
+        # Chroma from 2x2 block averages.
+        r, g, b = ((c[0::2, 0::2] + c[1::2, 0::2] + c[0::2, 1::2] + c[1::2, 1::2]) / 4 for c in (r, g, b))
+        cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+        cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+        frame = b"FRAME\n" + b"".join(np.clip(c + 0.5, 0, 255).astype(np.uint8).tobytes() for c in (y, cb, cr))
+        if self.last is not None:
+            for _ in range(seq - self.next_seq):
+                self.file.write(self.last)
+        self.file.write(frame)
+        self.last, self.next_seq = frame, seq + 1
+
+    def close(self):
+        self.file.close()
+
+
+def _encode(name, slots, size, pitch, channels, fps, path, ready):
+    # Runs in the encoder process: drains the ring in order until the
+    # recorder closes it, leaving the frame loop nothing but a copy.
+    if hasattr(os, "nice"):
+        os.nice(10)  # on a busy machine the game should win the CPU, not the encoder
+    shm = shared_memory.SharedMemory(name=name)
+    ctrl, seqs, encode_s, frames = _layout(slots, pitch * size[1], shm.buf)
+    writer = (Y4mVideo if path.endswith(".y4m") else PngSequence)(path, size, fps)
+    try:
+        while True:
+            ready.acquire(timeout=0.2)
+            while ctrl[TAIL] < ctrl[HEAD]:
+                start = time.perf_counter()
+                k = ctrl[TAIL] % slots
+                pixels = frames[k].reshape(size[1], pitch // 4, 4)[:, :size[0]]
+                writer.write(int(seqs[k]), pixels[..., channels])
+                ctrl[TAIL] += 1
+                encode_s[0] += time.perf_counter() - start
+            if ctrl[CLOSING]:
+                break
+    finally:
+        writer.close()
+        del ctrl, seqs, encode_s, frames
+        shm.close()
+
+
+class VideoRecorder:
+    # Copies rendered frames into a ring of shared-memory slots for an encoder
+    # process to write out. Slots are handed over with two counters, so a
+    # capture is one memcpy and a semaphore post; when every slot is still
+    # waiting to be encoded, the frame is dropped instead of waiting.
+    def __init__(self, path, surface, fps=60, slots=SLOTS):
+        self.size = surface.get_size()
+        if surface.get_bytesize() != 4:
+            raise ValueError("video capture needs a 32-bit surface")
+        pitch = self.pitch = surface.get_pitch()
+        # Byte offsets of red, green and blue within a little-endian pixel.
+        channels = [shift // 8 for shift in surface.get_shifts()[:3]]
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=_shared_size(slots, pitch * self.size[1]))
+        self.ctrl, self.seqs, self.encode_s, self.frames = _layout(slots, pitch * self.size[1], self.shm.buf)
+        # Zeroing touches every page now rather than during the first captures.
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.interval = 1.0 / fps
+        self.next_capture = 0.0
+        self.seq = 0
+        self.captured = 0
+        self.dropped = 0
+        self.overhead = 0.0
+        self.worst = 0.0
+        context = multiprocessing.get_context("spawn")
+        self.ready = context.Semaphore(0)
+        self.process = context.Process(target=_encode, daemon=True, name="video encoder",
+                                       args=(self.shm.name, slots, self.size, pitch, channels, fps, path,
+                                             self.ready))
+        self.process.start()
+
+    def capture(self, surface, now=None):
+        start = time.perf_counter()
+        now = start if now is None else now
+        if now < self.next_capture:
+            return False
+        # Frames are numbered by capture time, dropped or not.
+        self.next_capture = max(self.next_capture + self.interval, now - self.interval)
+        seq = self.seq
+        self.seq += 1
+        head = int(self.ctrl[HEAD])
+        if (head - self.ctrl[TAIL] >= self.slots or surface.get_size() != self.size
+                or surface.get_pitch() != self.pitch or not self.process.is_alive()):
+            self.dropped += 1
+            return False
+        k = head % self.slots
+        self.frames[k] = np.frombuffer(surface.get_buffer(), dtype=np.uint8)
+        self.seqs[k] = seq
+        self.ctrl[HEAD] = head + 1
+        self.ready.release()
+        self.captured += 1
+        spent = time.perf_counter() - start
+        self.overhead += spent
+        self.worst = max(self.worst, spent)
+        return True
+
+    def close(self, timeout=10.0):
+        # Lets the encoder finish what is already captured.
+        self.ctrl[CLOSING] = 1
+        self.ready.release()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        report = self.report()
+        del self.ctrl, self.seqs, self.encode_s, self.frames
+        self.shm.close()
+        self.shm.unlink()
+        return report
+
+    def report(self):
+        encoded = int(self.ctrl[TAIL])
+        return {"captured": self.captured, "dropped": self.dropped, "encoded": encoded,
+                "capture_ms": round(self.overhead * 1000 / max(self.captured, 1), 4),
+                "worst_capture_ms": round(self.worst * 1000, 4),
+                "encode_ms": round(float(self.encode_s[0]) * 1000 / max(encoded, 1), 4)}
+
+    def lines(self, report=None):
+        r = report or self.report()
+        return [f"video: {r['captured']} frames captured, {r['dropped']} dropped, {r['encoded']} encoded",
+                f"  capture {r['capture_ms']:.3f} ms/frame (worst {r['worst_capture_ms']:.3f}), "
+                f"encode {r['encode_ms']:.1f} ms/frame"]
@@ -0,0 +1,258 @@
+import argparse
+import multiprocessing as mp
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from sim import Simulation, MAX_BALLS, MAX_BALL_SPEED
+
+# Discrete actions for the agent's (left) paddle: stay, up, down.
+ACTIONS = np.array([0, -1, 1])
+OBS_BALLS = MAX_BALLS
+PIXEL_SCALE = 8
+
+
+def observation_size(obs_balls=OBS_BALLS):
+    return 4 + 5 * obs_balls
+
+
+class PixelRenderer:
+    # Draws matches into a small off-screen greyscale surface. pygame is only
+    # imported here, so vector observations never need it.
+    def __init__(self, width, height, scale=PIXEL_SCALE):
+        import pygame
+        self.pygame = pygame
+        self.scale = scale
+        self.surface = pygame.Surface((width // scale, height // scale))
+        self.shape = (height // scale, width // scale)
+
+    def render(self, sim, out):
+        pg, surf, k = self.pygame, self.surface, self.scale
+        for n in range(sim.n):
+            surf.fill((0, 0, 0))
+            for _, (x, y, w, h), _ in sim.powerup_items(n):
+                pg.draw.rect(surf, (128, 128, 128), (x // k, y // k, max(1, w // k), max(1, h // k)))
+            for x, y, w, h in sim.paddle_rects(n):
+                pg.draw.rect(surf, (255, 255, 255), (x // k, y // k, max(1, w // k), max(1, h // k)))
+            for x, y, w, h in sim.ball_rects(n):
+                pg.draw.rect(surf, (255, 255, 255), (x // k, y // k, max(1, w // k), max(1, h // k)))
+            out[n] = pg.surfarray.pixels_red(surf).T
+
+
+class PongEnv:
+    # A batch of matches with a reset()/step() interface. The agent plays the
+    # left paddle against the built-in AI; reward is +1 per point won and -1
+    # per point lost. Finished matches are reset automatically with a fresh
+    # seed, so step() can be called forever.
+    def __init__(self, num_envs=1, seed=0, pixels=False, pixel_scale=PIXEL_SCALE, frame_skip=1,
+                 max_steps=None, obs_balls=OBS_BALLS, env_offset=0, total_envs=None, **params):
+        self.num_envs = num_envs
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.obs_balls = obs_balls
+        self.base_seed = np.uint64(seed) + np.arange(env_offset, env_offset + num_envs, dtype=np.uint64)
+        self.seed_stride = np.uint64(total_envs or num_envs)
+        self.episodes = np.zeros(num_envs, dtype=np.uint64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.sim = Simulation(num_envs, seed=self.base_seed, ai=(False, True), **params)
+        self.renderer = PixelRenderer(self.sim.width, self.sim.height, pixel_scale) if pixels else None
+        if self.renderer:
+            self.observation_shape = self.renderer.shape
+            self.observation_dtype = np.uint8
+        else:
+            self.observation_shape = (observation_size(obs_balls),)
+            self.observation_dtype = np.float32
+        self._actions = np.zeros((num_envs, 2), dtype=np.int64)
+
+    def observe(self, out=None):
+        if out is None:
+            out = np.empty((self.num_envs,) + self.observation_shape, dtype=self.observation_dtype)
+        sim = self.sim
+        if self.renderer:
+            self.renderer.render(sim, out)
+            return out
+        out[:, 0:2] = sim.paddle_y / sim.height
+        out[:, 2:4] = sim.paddle_h / sim.height
+        # The balls closest to the agent's goal come first; empty slots are zero.
+        k = min(self.obs_balls, sim.ball_capacity)
+        order = np.argsort(np.where(sim.ball_alive, sim.ball_x, np.inf), axis=1, kind="stable")[:, :k]
+        take = lambda a: np.take_along_axis(a, order, axis=1)
+        alive = take(sim.ball_alive)
+        balls = out[:, 4:].reshape(self.num_envs, self.obs_balls, 5)
+        balls[:] = 0
+        balls[:, :k, 0] = alive
+        balls[:, :k, 1] = np.where(alive, take(sim.ball_x) / sim.width, 0)
+        balls[:, :k, 2] = np.where(alive, take(sim.ball_y) / sim.height, 0)
+        balls[:, :k, 3] = np.where(alive, take(sim.ball_vx) / MAX_BALL_SPEED, 0)
+        balls[:, :k, 4] = np.where(alive, take(sim.ball_vy) / MAX_BALL_SPEED, 0)
+        return out
+
+    def reset(self, out=None):
+        self.episodes[:] = 0
+        self.steps[:] = 0
+        self.sim.seed[:] = self.base_seed
+        self.sim.reset()
+        return self.observe(out)
+
+    def step(self, actions, obs=None, reward=None, done=None):
+        sim = self.sim
+        if reward is None:
+            reward = np.empty(self.num_envs, dtype=np.float32)
+        if done is None:
+            done = np.empty(self.num_envs, dtype=bool)
+        self._actions[:, 0] = ACTIONS[np.asarray(actions)]
+        before = sim.score.copy()
+        for _ in range(self.frame_skip):
+            sim.step(self._actions)
+        gained = sim.score - before
+        reward[:] = gained[:, 0] - gained[:, 1]
+        self.steps += 1
+        done[:] = sim.done
+        if self.max_steps is not None:
+            done |= self.steps >= self.max_steps
+        score = sim.score.copy()
+        if done.any():
+            self.episodes[done] += np.uint64(1)
+            self.steps[done] = 0
+            sim.seed[done] = self.base_seed[done] + self.episodes[done] * self.seed_stride
+            sim.reset(done)
+        return self.observe(obs), reward, done, {"score": score}
+
+
+def _worker(conn, names, start, count, kwargs):
+    env = PongEnv(count, env_offset=start, **kwargs)
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    total = kwargs["total_envs"]
+    obs, reward, done, actions = (
+        np.ndarray((total,) + shape, dtype=dtype, buffer=block.buf)[start:start + count]
+        for block, (shape, dtype) in zip(blocks, _buffer_specs(env)))
+    try:
+        while True:
+            cmd = conn.recv()
+            if cmd == "step":
+                _, _, _, info = env.step(actions, obs, reward, done)
+                conn.send(info["score"])
+            elif cmd == "reset":
+                env.reset(obs)
+                conn.send(None)
+            else:
+                break
+    finally:
+        del obs, reward, done, actions
+        for block in blocks:
+            block.close()
+        conn.close()
+
+
+def _buffer_specs(env):
+    return [(env.observation_shape, env.observation_dtype), ((), np.float32), ((), np.bool_), ((), np.int64)]
+
+
+class VectorEnv:
+    # Spreads num_envs matches over worker processes. Observations, rewards,
+    # dones and actions live in shared memory, so only a one-word command and
+    # the scores cross the pipes each step.
+    def __init__(self, num_envs, num_workers=None, seed=0, copy=True, **kwargs):
+        num_workers = min(num_envs, num_workers or mp.cpu_count())
+        self.num_envs = num_envs
+        self.copy = copy
+        kwargs = dict(kwargs, seed=seed, total_envs=num_envs)
+        probe = PongEnv(1, **kwargs)
+        self.observation_shape = probe.observation_shape
+        self.observation_dtype = probe.observation_dtype
+        self.blocks = []
+        arrays = []
+        for shape, dtype in _buffer_specs(probe):
+            full = (num_envs,) + shape
+            block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(full)) * np.dtype(dtype).itemsize))
+            self.blocks.append(block)
+            arrays.append(np.ndarray(full, dtype=dtype, buffer=block.buf))
+        self.obs, self.reward, self.done, self.actions = arrays
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self.slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+        self.pipes, self.workers = [], []
+        names = [block.name for block in self.blocks]
+        for s in self.slices:
+            parent, child = mp.Pipe()
+            worker = mp.Process(target=_worker, args=(child, names, s.start, s.stop - s.start, kwargs), daemon=True)
+            worker.start()
+            child.close()
+            self.pipes.append(parent)
+            self.workers.append(worker)
+        self.closed = False
+
+    def _result(self, a):
+        return a.copy() if self.copy else a
+
+    def reset(self):
+        for pipe in self.pipes:
+            pipe.send("reset")
+        for pipe in self.pipes:
+            pipe.recv()
+        return self._result(self.obs)
+
+    def step(self, actions):
+        self.actions[:] = actions
+        for pipe in self.pipes:
+            pipe.send("step")
+        score = np.concatenate([pipe.recv() for pipe in self.pipes])
+        return self._result(self.obs), self._result(self.reward), self._result(self.done), {"score": score}
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for pipe in self.pipes:
+            try:
+                pipe.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.obs = self.reward = self.done = self.actions = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure environment throughput with random actions")
+    parser.add_argument("--envs", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0: run in-process)")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--pixels", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        env = VectorEnv(args.envs, args.workers, seed=args.seed, pixels=args.pixels)
+    else:
+        env = PongEnv(args.envs, seed=args.seed, pixels=args.pixels)
+    rng = np.random.default_rng(args.seed)
+    env.reset()
+    points = 0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        _, reward, _, _ = env.step(rng.integers(0, len(ACTIONS), args.envs))
+        points += np.abs(reward).sum()
+    elapsed = time.perf_counter() - start
+    if args.workers:
+        env.close()
+    print(f"{args.envs} envs x {args.steps} steps in {elapsed:.2f}s: "
+          f"{args.envs * args.steps / elapsed:,.0f} steps/s, {int(points)} points scored")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import random
+import socket
+import struct
+import sys
+import time
+import numpy as np
+from sim import Simulation, TICK_RATE
+
+TICK = 1.0 / TICK_RATE
+MAX_ROLLBACK = 12       # ticks the local side may run ahead of the last remote input
+SYNC_INTERVAL = 10      # at most one time-sync skip per this many ticks
+MAX_WINDOW = 64         # unacknowledged inputs resent in every packet
+CHECK_INTERVAL = 60     # ticks between state checksums compared across peers
+UDP_OVERHEAD = 28       # IPv4 + UDP headers, counted in the bandwidth figures
+LINGER = 1.0            # keep sending after a match so the peer hears our last acks
+DISCONNECT_AFTER = 5.0
+
+HELLO, WELCOME, INPUT = b"H", b"W", b"I"
+NO_CHECK = 0xFFFFFFFF
+# kind, remote inputs held, checksum tick, checksum, first input tick, input count
+INPUT_HEADER = struct.Struct("<cIIIIB")
+WELCOME_FORMAT = struct.Struct("<cQ")
+
+
+def pack_inputs(values):
+    # -1/0/1 in two bits each, four to a byte.
+    data = bytearray((len(values) + 3) // 4)
+    for i, v in enumerate(values):
+        data[i >> 2] |= (v + 1) << ((i & 3) * 2)
+    return bytes(data)
+
+
+def unpack_inputs(data, count):
+    return [((data[i >> 2] >> ((i & 3) * 2)) & 3) - 1 for i in range(count)]
+
+
+class RollbackSession:
+    # One match between a local and a remote player that never waits a round
+    # trip: a tick missing the remote input is simulated with the last input
+    # heard from the peer. When a real input contradicts that guess the match
+    # is restored from the snapshot taken before the tick and simulated
+    # forward again. Only the local side's paddle is ever sent.
+    def __init__(self, side, seed, max_rollback=MAX_ROLLBACK, **params):
+        self.sim = Simulation(1, seed=seed, ai=(False, False), record_events=True, **params)
+        self.side = side
+        self.max_rollback = max_rollback
+        self.tick = 0
+        self.local = []
+        self.remote = []
+        self.guesses = []
+        self.snapshots = {}
+        self.rewind_to = None
+        self.remote_ack = 0
+        self.remote_tick = 0
+        self.remote_advantage = 0
+        self.last_sync = -SYNC_INTERVAL
+        # Checksums of finished checkpoint ticks, ours and the peer's.
+        self.checks = {}
+        self.final = {}
+        self.final_check = (NO_CHECK, 0)
+        self.remote_checks = {}
+        self.depths = []
+        self.resimulated = 0
+        self.stalls = 0
+        self.syncs = 0
+        self.desyncs = 0
+
+    @property
+    def confirmed(self):
+        return min(len(self.remote), self.tick)
+
+    @property
+    def settled(self):
+        # Nothing shown is a guess any more.
+        return len(self.remote) >= self.tick and self.rewind_to is None
+
+    def _step(self, t):
+        if t % CHECK_INTERVAL == 0:
+            self.checks[t] = self.sim.checksum()
+        self.snapshots[t] = self.sim.snapshot()
+        guess = self.remote[t] if t < len(self.remote) else self.remote[-1] if self.remote else 0
+        if t < len(self.guesses):
+            self.guesses[t] = guess
+        else:
+            self.guesses.append(guess)
+        pair = [0, 0]
+        pair[self.side] = self.local[t]
+        pair[1 - self.side] = guess
+        self.sim.step([pair])
+
+    def can_advance(self):
+        if self.tick - len(self.remote) >= self.max_rollback:
+            self.stalls += 1
+            return False
+        # Both sides should be equally far ahead of what they have heard from
+        # each other; the one further ahead skips a tick now and then.
+        if self.tick - self.remote_tick - self.remote_advantage > 2 and self.tick - self.last_sync >= SYNC_INTERVAL:
+            self.last_sync = self.tick
+            self.syncs += 1
+            return False
+        return True
+
+    def advance(self, local_input):
+        # Returns False when this tick is skipped to wait for the peer.
+        self.resolve()
+        if not self.can_advance():
+            return False
+        self.local.append(local_input)
+        self._step(self.tick)
+        self.tick += 1
+        self._prune()
+        return True
+
+    def resolve(self):
+        if self.rewind_to is None:
+            return
+        start, self.rewind_to = self.rewind_to, None
+        self.sim.restore(self.snapshots[start])
+        for t in range(start, self.tick):
+            self._step(t)
+        self.depths.append(self.tick - start)
+        self.resimulated += self.tick - start
+        self._prune()
+
+    def _prune(self):
+        # Ticks before every remote input is known (and before a pending
+        # rewind) are final: their snapshots go and their checksums count.
+        final = self.confirmed if self.rewind_to is None else min(self.confirmed, self.rewind_to)
+        for t in [t for t in self.snapshots if t < final]:
+            del self.snapshots[t]
+        for t in [t for t in self.checks if t <= final]:
+            self.final[t] = self.checks.pop(t)
+            self.final_check = (t, self.final[t])
+            if len(self.final) > 8:
+                del self.final[next(iter(self.final))]
+        for t in [t for t in self.remote_checks if t in self.final]:
+            if self.remote_checks.pop(t) != self.final[t]:
+                self.desyncs += 1
+
+    def packet(self):
+        first = self.remote_ack
+        values = self.local[first:first + MAX_WINDOW]
+        return INPUT_HEADER.pack(INPUT, len(self.remote), *self.final_check, first, len(values)) + pack_inputs(values)
+
+    def receive(self, data):
+        _, ack, check_tick, check, first, count = INPUT_HEADER.unpack_from(data)
+        self.remote_ack = max(self.remote_ack, ack)
+        if first + count > self.remote_tick:
+            self.remote_tick = first + count
+            self.remote_advantage = first + count - ack
+        if check_tick != NO_CHECK:
+            self.remote_checks[check_tick] = check
+        if first > len(self.remote):
+            return  # a gap; the missing inputs come again in the next packet
+        values = unpack_inputs(data[INPUT_HEADER.size:], count)
+        for t in range(len(self.remote), first + count):
+            value = values[t - first]
+            if t < self.tick and self.guesses[t] != value and (self.rewind_to is None or t < self.rewind_to):
+                self.rewind_to = t
+            self.remote.append(value)
+        self._prune()
+
+
+class NetPeer(asyncio.DatagramProtocol):
+    # One end of an online match. The host plays the left paddle and picks
+    # the seed. Outgoing datagrams can be delayed, jittered and dropped to try
+    # the netcode on loopback; latency is one-way, so the round trip is twice it.
+    def __init__(self, side, latency=0.0, jitter=0.0, loss=0.0, noise_seed=None):
+        self.side = side
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(noise_seed)
+        self.loop = asyncio.get_running_loop()
+        self.ready = self.loop.create_future()
+        self.transport = None
+        self.address = None
+        self.seed = None
+        self.session = None
+        self.sender = None
+        self.started = time.perf_counter()
+        self.last_heard = self.started
+        self.last_sent = 0.0
+        self.sent = 0
+        self.received = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        pass  # e.g. port unreachable while the other side is still starting
+
+    def datagram_received(self, data, address):
+        self.received += len(data) + UDP_OVERHEAD
+        self.packets_received += 1
+        kind = data[:1]
+        if kind == HELLO and self.side == 0:
+            if self.address is None:
+                self.address = address
+            if address == self.address:
+                self.send(WELCOME_FORMAT.pack(WELCOME, self.seed))
+                if not self.ready.done():
+                    self.ready.set_result(None)
+        elif kind == WELCOME and self.side == 1 and not self.ready.done():
+            self.seed = WELCOME_FORMAT.unpack(data)[1]
+            self.ready.set_result(None)
+        elif kind == INPUT and address == self.address and self.session is not None:
+            self.last_heard = time.perf_counter()
+            self.session.receive(data)
+
+    def send(self, data):
+        self.sent += len(data) + UDP_OVERHEAD
+        self.packets_sent += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            self.loop.call_later(delay, self._sendto, data)
+        else:
+            self._sendto(data)
+
+    def _sendto(self, data):
+        if not self.transport.is_closing():
+            self.transport.sendto(data, self.address)
+
+    def start(self, session):
+        self.session = session
+        self.started = self.last_heard = time.perf_counter()
+        self.sent = self.received = self.packets_sent = self.packets_received = self.dropped = 0
+        self.sender = self.loop.create_task(self._send_loop())
+
+    def send_inputs(self):
+        # Called after every tick; the timer below only covers the gaps when
+        # the owner is not ticking (waiting, or lingering after a match).
+        self.last_sent = time.perf_counter()
+        self.send(self.session.packet())
+
+    async def _send_loop(self):
+        while True:
+            if time.perf_counter() - self.last_sent >= TICK:
+                self.send_inputs()
+            await asyncio.sleep(TICK / 2)
+
+    @property
+    def lost(self):
+        return time.perf_counter() - self.last_heard > DISCONNECT_AFTER
+
+    def close(self, linger=0.0):
+        if linger:
+            self.loop.call_later(linger, self.close)
+            return
+        if self.sender:
+            self.sender.cancel()
+        self.transport.close()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        s = self.session
+        depths = np.array(s.depths or [0])
+        return {
+            "side": "left" if self.side == 0 else "right", "ticks": s.tick, "seconds": round(elapsed, 2),
+            "rollbacks": len(s.depths), "resimulated_ticks": s.resimulated,
+            "rollback_depth_mean": round(float(depths.mean()), 2),
+            "rollback_depth_p95": round(float(np.percentile(depths, 95)), 1), "rollback_depth_max": int(depths.max()),
+            "stalls": s.stalls, "time_syncs": s.syncs, "desyncs": s.desyncs,
+            "sent_kbps": round(self.sent * 8 / 1000 / elapsed, 2),
+            "received_kbps": round(self.received * 8 / 1000 / elapsed, 2),
+            "packets_sent": self.packets_sent, "packets_received": self.packets_received,
+            "packets_dropped": self.dropped, "checksum": s.sim.checksum(),
+        }
+
+
+async def host_match(port, seed, **conditions):
+    peer = NetPeer(0, **conditions)
+    peer.seed = seed
+    await peer.loop.create_datagram_endpoint(lambda: peer, local_addr=("0.0.0.0", port))
+    await peer.ready
+    return peer
+
+
+async def join_match(address, retry=0.25, **conditions):
+    peer = NetPeer(1, **conditions)
+    info = await peer.loop.getaddrinfo(*address, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    peer.address = info[0][4]
+    await peer.loop.create_datagram_endpoint(lambda: peer, local_addr=("0.0.0.0", 0))
+    while not peer.ready.done():
+        peer.send(HELLO)
+        await asyncio.wait([peer.ready], timeout=retry)
+    return peer
+
+
+def parse_address(text):
+    name, _, port = text.rpartition(":")
+    return name or "127.0.0.1", int(port)
+
+
+def make_bot(side, seed):
+    # Chases the first ball but only changes its mind every few ticks, like a
+    # person would, so the peer's guesses are sometimes wrong.
+    rng = random.Random(seed)
+    state = {"hold": 0, "action": 0}
+
+    def bot(sim):
+        if state["hold"] <= 0:
+            b = sim.first_ball()[0]
+            target = sim.ball_y[0, b] + sim.ball_size[0, b] / 2 + rng.uniform(-60, 60)
+            center = sim.paddle_y[0, side] + sim.paddle_h[0, side] / 2
+            state["action"] = int(np.sign(target - center)) if abs(target - center) > 10 else 0
+            state["hold"] = rng.randint(2, 12)
+        state["hold"] -= 1
+        return state["action"]
+    return bot
+
+
+async def play_headless(role, address, ticks, seed, conditions, params):
+    peer = await (host_match(address[1], seed, **conditions) if role == "host" else join_match(address, **conditions))
+    session = RollbackSession(peer.side, peer.seed, **params)
+    peer.start(session)
+    bot = make_bot(peer.side, seed + peer.side)
+    next_tick = time.perf_counter()
+    while len(session.remote) < ticks or session.remote_ack < ticks or session.tick < ticks:
+        if peer.lost:
+            break
+        next_tick += TICK
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        if session.tick < ticks:
+            session.advance(bot(session.sim))
+        else:
+            session.resolve()
+        peer.send_inputs()
+    report = peer.report()
+    await asyncio.sleep(LINGER)
+    peer.close()
+    return report
+
+
+def _run_headless(args, queue=None):
+    report = asyncio.run(play_headless(*args))
+    if queue is not None:
+        queue.put(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless online Pong peers for trying the rollback netcode")
+    parser.add_argument("role", choices=["host", "join", "loopback"],
+                        help="loopback runs a host and a joiner as two local processes")
+    parser.add_argument("address", nargs="?", default="127.0.0.1:5005", help="[HOST:]PORT")
+    parser.add_argument("--ticks", type=int, default=1800)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="one-way delay added to sends, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- variation of the delay, ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of datagrams dropped")
+    parser.add_argument("--win-score", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.address)
+    conditions = {"latency": args.latency / 1000, "jitter": args.jitter / 1000, "loss": args.loss}
+    params = {"win_score": args.win_score}
+    if args.role != "loopback":
+        report = _run_headless((args.role, address, args.ticks, args.seed, dict(conditions, noise_seed=args.seed), params))
+        print(json.dumps(report, indent=2))
+        return 0
+
+    queue = mp.Queue()
+    procs = [mp.Process(target=_run_headless, args=((role, address, args.ticks, args.seed,
+                                                     dict(conditions, noise_seed=args.seed + i), params), queue))
+             for i, role in enumerate(["host", "join"])]
+    for p in procs:
+        p.start()
+    reports = sorted((queue.get(timeout=args.ticks * TICK + 30) for _ in procs), key=lambda r: r["side"])
+    for p in procs:
+        p.join()
+    for report in reports:
+        print(json.dumps(report))
+    same = reports[0]["checksum"] == reports[1]["checksum"] and not any(r["desyncs"] for r in reports)
+    print("in sync" if same else "DESYNC")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import math
+import numpy as np
+from render import SpriteCache
+
+
+class ParticleSystem:
+    # Live particles are packed into the first `count` slots of preallocated
+    # arrays; dead ones are compacted away and their slots reused by emit().
+    def __init__(self, capacity, radius, fade, gravity=0.0, rng=None, sprites=None):
+        self.capacity = capacity
+        self.radius = radius
+        self.fade = fade
+        self.gravity = gravity
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), dtype=np.float32)
+        self.vel = np.zeros((capacity, 2), dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.alpha = np.zeros(capacity, dtype=np.int32)
+        self.sprites = sprites if sprites is not None else SpriteCache()
+        # Without blending particles are drawn as solid squares, which blit
+        # several times faster; the quality governor turns this off under load.
+        self.blend = True
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, pos, vel, life, color):
+        k = min(len(life), self.capacity - self.count)
+        if k <= 0:
+            return
+        s = slice(self.count, self.count + k)
+        self.pos[s] = pos
+        self.vel[s] = vel[:k]
+        self.life[s] = life[:k]
+        self.color[s] = color[:k] if np.ndim(color) == 2 else color
+        self.alpha[s] = np.minimum(255, 255 * self.life[s] // self.fade)
+        self.count += k
+
+    def burst(self, pos, color, count=15):
+        vel = self.rng.uniform(-3, 3, (count, 2))
+        life = self.rng.integers(15, 31, count)
+        self.emit(pos, vel, life, color)
+
+    def confetti(self, pos, count=35):
+        angle = self.rng.uniform(0, 2 * math.pi, count)
+        speed = self.rng.uniform(2, 6, count)
+        vel = np.stack([speed * np.cos(angle), speed * np.sin(angle) - 2], axis=1)
+        life = self.rng.integers(40, 61, count)
+        color = self.rng.integers(100, 256, (count, 3))
+        self.emit(pos, vel, life, color)
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        self.pos[:n] += self.vel[:n]
+        self.vel[:n, 1] += self.gravity
+        self.life[:n] -= 1
+        self.alpha[:n] = np.maximum(0, 255 * self.life[:n] // self.fade)
+        keep = self.life[:n] > 0
+        m = int(keep.sum())
+        if m < n:
+            for a in (self.pos, self.vel, self.life, self.color, self.alpha):
+                a[:m] = a[:n][keep]
+            self.count = m
+
+    def draw(self, surface):
+        n = self.count
+        if not n:
+            return
+        # One sprite lookup per distinct (colour, alpha/16) pair, then a single blits() call.
+        c = self.color[:n].astype(np.int64)
+        shape = "circle" if self.blend else "square"
+        keys = (c[:, 0] << 28) | (c[:, 1] << 20) | (c[:, 2] << 12) | (self.alpha[:n] >> 4 if self.blend else 15)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        glyphs = [self.sprites.get(shape, self.radius, ((k >> 28) & 255, (k >> 20) & 255, (k >> 12) & 255),
+                                   (k & 15) * 17)
+                  for k in unique.tolist()]
+        xy = self.pos[:n].astype(np.int32)
+        surface.blits([(glyphs[i], p) for i, p in zip(inverse.tolist(), xy.tolist())], doreturn=False)
+        x0, y0 = xy.min(axis=0)
+        x1, y1 = xy.max(axis=0) + 2 * self.radius
+        return (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
@@ -1,21 +1,42 @@
+import time
+START_TIME = time.perf_counter()  # taken before the heavy imports, for the startup report
 import pygame
 import sys
 import random
 import asyncio
-import math
 import os
 import json
+import argparse
+import threading
+import numpy as np
+from sim import Simulation, TICK_RATE, DIFFICULTIES, CHAOS
+from powerups import POWERUPS
+from particles import ParticleSystem
+from render import SpriteCache, FontRegistry, TextCache, DirtyRects, Trails, Viewport, ball_sprites
+from replay import ReplayRecorder
+from capture import VideoRecorder
+from runner import Frame, InputQueue, SimRunner
+from broadcast import Broadcaster, watch
+from netplay import RollbackSession, host_match, join_match, parse_address, LINGER
+from profiler import Profiler, StartupReport
+from quality import QualityGovernor, QUALITY_NAMES
+from storage import Persistence, StatsStore
+from audio import SoundBank
 
 WIDTH, HEIGHT = 1000, 600
 FPS = 60
+TICK = 1.0 / TICK_RATE
+MAX_FRAME_TIME = 0.25
+MAX_BURSTS = 6          # hit and wall bursts per tick; Chaos can raise dozens at once
 CONFIG_FILE = "pong_settings.json"
+HISTORY_FILE = "pong_history.jsonl"
+STATS_FILE = "pong_stats.json"
+FONT_CACHE_FILE = "pong_fonts.json"
+SOUND_CACHE_FILE = "pong_sounds.npz"
 
-def get_modern_font(size):
-    try:
-        return pygame.font.SysFont("SF Pro Display,Arial,sans-serif", size, bold=True)
-    except Exception:
-        return pygame.font.Font(None, size)
+MODERN_FONT = "SF Pro Display,Arial,sans-serif"
 
+# "trail" is (length in ticks, share of alpha kept per tick) for the ball trails.
 THEMES = {
     "Dark": {
         "bg": (15, 15, 35),
@@ -27,7 +48,8 @@ THEMES = {
         "paddle": (100, 200, 255),
         "ball": (255, 150, 100),
         "particle": (255, 200, 150),
-        "paused": (200, 50, 50)
+        "paused": (200, 50, 50),
+        "trail": (20, 0.85)
     },
     "Light": {
         "bg": (240, 240, 255),
@@ -39,7 +61,8 @@ THEMES = {
         "paddle": (0, 120, 255),
         "ball": (255, 150, 100),
         "particle": (255, 200, 150),
-        "paused": (200, 50, 50)
+        "paused": (200, 50, 50),
+        "trail": (14, 0.8)
     },
     "Colorblind": {
         "bg": (20, 20, 20),
@@ -51,25 +74,11 @@ THEMES = {
         "paddle": (255, 255, 0),
         "ball": (255, 90, 90),
         "particle": (255, 220, 0),
-        "paused": (255, 150, 0)
+        "paused": (255, 150, 0),
+        "trail": (24, 0.9)
     }
 }
 
-WIN_SCORE = 10
-BALL_SPEED = 7
-AI_SPEED = 6
-AI_MISS_CHANCE = 0.08
-AI_PREDICT = True
-
-POWERUP_TYPES = ["Speed", "Size", "MultiBall"]
-
-def save_settings(settings):
-    try:
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(settings, f)
-    except Exception:
-        pass
-
 def load_settings():
     if not os.path.exists(CONFIG_FILE):
         return {}
@@ -79,162 +88,128 @@ def load_settings():
     except Exception:
         return {}
 
-class Particle:
-    def __init__(self, pos, color):
-        self.pos = list(pos)
-        self.velocity = [random.uniform(-3, 3), random.uniform(-3, 3)]
-        self.lifetime = random.randint(15, 30)
-        self.color = color
-        self.alpha = 255
-
-    def update(self):
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
-        self.lifetime -= 1
-        self.alpha = max(0, int(255 * self.lifetime / 30))
-        return self.lifetime > 0
-
-class ConfettiParticle:
-    def __init__(self, pos):
-        self.pos = list(pos)
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(2, 6)
-        self.velocity = [speed * math.cos(angle), speed * math.sin(angle) - 2]
-        self.lifetime = random.randint(40, 60)
-        self.color = (
-            random.randint(100, 255),
-            random.randint(100, 255),
-            random.randint(100, 255)
-        )
-        self.alpha = 255
-
-    def update(self):
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
-        self.velocity[1] += 0.15  # gravity
-        self.lifetime -= 1
-        self.alpha = max(0, int(255 * self.lifetime / 60))
-        return self.lifetime > 0
-
-class PowerUp:
-    def __init__(self, rect, kind):
-        self.rect = rect
-        self.kind = kind
-        self.color = (random.randint(150, 255), random.randint(150, 255), random.randint(150, 255))
-
-    def draw(self, surface):
-        pygame.draw.rect(surface, self.color, self.rect, border_radius=10)
-        font = pygame.font.Font(None, 28)
-        txt = font.render(self.kind[0], True, (0, 0, 0))
-        surface.blit(txt, (self.rect.x + 7, self.rect.y + 7))
-
 class Button:
     def __init__(self, text, x, y, width=220, height=50):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.hovered = False
         self.selected = False
+        self.surfaces = {}
 
-    def draw(self, surface, font, theme, alpha=255):
-        color = theme["button_hover"] if self.hovered or self.selected else theme["button"]
+    @property
+    def state(self):
+        return "hovered" if self.hovered else "selected" if self.selected else "normal"
+
+    def compose(self, font, theme, state):
+        highlighted = state != "normal"
+        color = theme["button_hover"] if highlighted else theme["button"]
+        border = theme["accent"] if highlighted else theme["menu_bg"]
         surf = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
-        fill = color + (alpha,)
-        border = theme["accent"] + (alpha,) if self.hovered or self.selected else theme["menu_bg"] + (alpha,)
-        pygame.draw.rect(surf, fill, (0,0,self.rect.width,self.rect.height), border_radius=10)
+        pygame.draw.rect(surf, color, (0,0,self.rect.width,self.rect.height), border_radius=10)
         pygame.draw.rect(surf, border, (0,0,self.rect.width,self.rect.height), 2, border_radius=10)
         text_surf = font.render(self.text, True, theme["text"])
         text_rect = text_surf.get_rect(center=(self.rect.width//2, self.rect.height//2))
         surf.blit(text_surf, text_rect)
-        surface.blit(surf, self.rect.topleft)
+        return surf.convert_alpha() if pygame.display.get_surface() else surf
 
-class Paddle:
-    def __init__(self, x, y, width=15, height=90, color=(255,255,255)):
-        self.rect = pygame.Rect(x, y, width, height)
-        self.base_height = height
-        self.color = color
-        self.speed = 7
-
-    def move(self, dy):
-        self.rect.y += dy
-        if self.rect.top < 0: self.rect.top = 0
-        if self.rect.bottom > HEIGHT: self.rect.bottom = HEIGHT
-
-    def reset(self, y=None):
-        self.rect.height = self.base_height
-        self.rect.centery = HEIGHT // 2 if y is None else y
-
-    def draw(self, surface, color=None):
-        pygame.draw.rect(surface, color if color else self.color, self.rect, border_radius=8)
-
-class Ball:
-    def __init__(self, speed, color=(255,255,255)):
-        self.rect = pygame.Rect(WIDTH//2 - 10, HEIGHT//2 - 10, 20, 20)
-        angle = random.uniform(-0.5, 0.5)
-        direction = random.choice([-1, 1])
-        self.vel = [direction * speed * math.cos(angle), speed * math.sin(angle)]
-        self.base_speed = speed
-        self.color = color
-
-    def move(self):
-        self.rect.x += int(self.vel[0])
-        self.rect.y += int(self.vel[1])
-
-    def bounce(self, axis):
-        if axis == 'x':
-            self.vel[0] *= -1
-        elif axis == 'y':
-            self.vel[1] *= -1
-
-    def increase_speed(self, factor):
-        self.vel[0] *= factor
-        self.vel[1] *= factor
-
-    def inflate(self, amount):
-        self.rect.inflate_ip(amount, amount)
-
-    def reset(self, speed=None):
-        self.rect.center = (WIDTH//2, HEIGHT//2)
-        angle = random.uniform(-0.5, 0.5)
-        direction = random.choice([-1, 1])
-        s = speed if speed else self.base_speed
-        self.vel = [direction * s * math.cos(angle), s * math.sin(angle)]
-
-    def draw(self, surface, color=None):
-        pygame.draw.ellipse(surface, color if color else self.color, self.rect)
+    def draw(self, surface, font, theme, alpha=255):
+        key = (id(theme), font, self.state, self.rect.size)
+        surf = self.surfaces.get(key)
+        if surf is None:
+            surf = self.surfaces[key] = self.compose(font, theme, self.state)
+        surf.set_alpha(alpha)
+        return surface.blit(surf, self.rect.topleft)
+
+    def invalidate(self):
+        self.surfaces.clear()
 
 class PongGame:
-    def __init__(self):
+    def __init__(self, seed=None, record_dir=None, profile=False, trace_path=None, startup=None,
+                 startup_report=False, sim_thread=False, online=None, broadcast_port=None, spectate=None,
+                 quality="auto", capture=None, capture_fps=FPS, full_redraw=False):
+        self.startup = startup or StartupReport(time.perf_counter())
+        self.startup_report = startup_report
         pygame.display.set_caption("Ultimate Pong Deluxe")
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+        # Everything is drawn to a WIDTH x HEIGHT canvas (self.screen) whatever
+        # the window size; the viewport scales it into the window.
+        self.window = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+        self.viewport = Viewport((WIDTH, HEIGHT))
+        self.viewport.resize(self.window)
+        self.screen = self.viewport.canvas
         self.clock = pygame.time.Clock()
-        self.font = get_modern_font(40)
-        self.big_font = get_modern_font(72)
-        self.title_font = get_modern_font(54)
+        # Rendered frames are copied to a background encoder process.
+        self.video = VideoRecorder(capture, self.screen, capture_fps) if capture else None
+        self.startup.mark("window")
+        self.sound_enabled = False
+        self.start_audio()
+        self.profiler = Profiler(enabled=profile or trace_path is not None)
+        self.profiler.overlay = profile
+        self.trace_path = trace_path
+        self.persistence = Persistence()
+        # Fonts load on first use, so only the menu's fonts are opened before
+        # the first frame.
+        self.fonts = FontRegistry(self.profiler, FONT_CACHE_FILE, self.persistence)
+        self.text_cache = TextCache()
         self.theme = "Dark"
         self.theme_colors = THEMES[self.theme]
         self.state = "menu"
         self.left_score = 0
         self.right_score = 0
-        self.particles = []
-        self.confetti = []
+        self.sprites = SpriteCache()
+        self.dirty = DirtyRects()
+        # --full-redraw pushes the whole window every frame, for comparison.
+        self.dirty_rendering = not full_redraw
+        self.particles = ParticleSystem(4096, radius=3, fade=30, sprites=self.sprites)
+        self.confetti = ParticleSystem(1024, radius=4, fade=60, gravity=0.15, sprites=self.sprites)
         self.winner = None
         self.paused = False
-        self.trail = []
+        self.trails = Trails((WIDTH, HEIGHT), self.sprites, *self.theme_colors["trail"])
+        # Effects are scaled back while frames run over budget, and restored
+        # once there is headroom again; a named --quality level stays put.
+        locked = quality != "auto"
+        self.governor = QualityGovernor(1.0 / FPS, level=QUALITY_NAMES.index(quality) if locked else 0,
+                                        locked=locked, on_change=self.apply_quality)
+        self.apply_quality(self.governor.settings)
         self.mode = "PvAI"
-        self.achievements = set()
+        # Settings, lifetime stats and match history are saved in the
+        # background; nothing here blocks the frame loop on the disk.
+        self.store = StatsStore(HISTORY_FILE, STATS_FILE, self.persistence).load()
+        self.achievements = self.store.achievements
         self.streak = 0
-        self.max_streak = 0
-        self.powerups = []
-        self.stats = {"games": 0, "wins": 0, "losses": 0}
+        self.max_streak = self.store.max_streak
+        self.stats = self.store.stats
         self.show_help = False
         self.menu_alpha = 0
         self.menu_fade_in = True
         self.menu_selected = 0
+        self.menu_background = None
         self.sound_on = True
+        self.difficulty = "Normal"
+        self.seed = seed
+        self.record_dir = record_dir
+        self.recorder = None
+        self.replay = None
+        # With sim_thread the match steps on its own thread and the frame loop
+        # only draws the latest published Frame (self.view).
+        self.threaded = sim_thread
+        self.runner = None
+        # Online play: {"host": port} or {"join": (host, port)}, plus the
+        # simulated network "conditions" for trying it on loopback.
+        self.online = online
+        self.net = None
+        self.session = None
+        self.net_text = ""
+        # Lobby screens: a broadcasting game streams every tick of its match;
+        # a spectating one draws the stream instead of playing.
+        self.broadcaster = Broadcaster(broadcast_port) if broadcast_port else None
+        self.spectate = spectate
+        self.watcher = None
 
         self.menu_buttons = [
             Button("Player vs AI", 0, 0),
             Button("Player vs Player", 0, 0),
+            Button("Chaos Mode", 0, 0),
+            Button("AI: Normal", 0, 0),
             Button("Switch Theme", 0, 0),
             Button("Colorblind Mode", 0, 0),
             Button("Toggle Sound", 0, 0),
@@ -246,170 +221,356 @@ class PongGame:
             "right_up": pygame.K_UP,
             "right_down": pygame.K_DOWN
         }
+        self.startup.mark("settings and stats")
         self.reset_game()
         self.load_config()
+        self.startup.mark("match setup")
 
+    @property
+    def font(self):
+        return self.fonts.get(MODERN_FONT, 40, bold=True)
+
+    @property
+    def big_font(self):
+        return self.fonts.get(MODERN_FONT, 72, bold=True)
+
+    @property
+    def title_font(self):
+        return self.fonts.get(MODERN_FONT, 54, bold=True)
+
+    @property
+    def small_font(self):
+        return self.fonts.get(None, 28)
+
+    def start_audio(self):
+        # Opening the audio device can take a while; do it alongside the first
+        # frames. sound_enabled flips once the mixer is ready.
+        try:
+            threading.Thread(target=self.init_audio, daemon=True).start()
+        except RuntimeError:
+            self.init_audio()
+
+    def init_audio(self):
+        start = time.perf_counter()
         try:
             pygame.mixer.init()
+            self.sounds = SoundBank(SOUND_CACHE_FILE)
             self.sound_enabled = True
-            self.snd_hit = pygame.mixer.Sound(pygame.mixer.Sound.buffer(b'\x00'*1000))
         except Exception:
             self.sound_enabled = False
+        self.startup.finished("audio", time.perf_counter() - start)
 
     def save_config(self):
         settings = {
             "theme": self.theme,
-            "mode": self.mode,
-            "sound_on": self.sound_on
+            "mode": "PvP" if self.mode == "Online" else self.mode,
+            "sound_on": self.sound_on,
+            "difficulty": self.difficulty
         }
-        save_settings(settings)
+        self.persistence.replace(CONFIG_FILE, json.dumps(settings).encode())
 
     def load_config(self):
         settings = load_settings()
-        self.theme = settings.get("theme", self.theme)
-        self.theme_colors = THEMES[self.theme]
+        self.set_theme(settings.get("theme", self.theme))
         self.mode = settings.get("mode", self.mode)
         self.sound_on = settings.get("sound_on", self.sound_on)
+        self.set_difficulty(settings.get("difficulty", self.difficulty))
+
+    def set_difficulty(self, difficulty):
+        self.difficulty = difficulty if difficulty in DIFFICULTIES else "Normal"
+        for button in self.menu_buttons:
+            if button.text.startswith("AI: "):
+                button.text = f"AI: {self.difficulty}"
+                button.invalidate()
+
+    def set_theme(self, theme):
+        self.theme = theme
+        self.theme_colors = THEMES[theme]
+        self.sprites.clear()
+        self.text_cache.clear()
+        self.dirty.invalidate()
+        self.menu_background = None
+        self.configure_trails()
+
+    def apply_quality(self, settings):
+        self.quality = settings
+        self.particles.blend = self.confetti.blend = settings["alpha"]
+        self.configure_trails()
+        self.dirty.invalidate()
+
+    def configure_trails(self):
+        length, decay = self.theme_colors["trail"]
+        self.trails.enabled = self.quality["trail"] > 0
+        self.trails.configure(max(2, round(length * self.quality["trail"])), decay)
+
+    def render_text(self, font, text, color):
+        return self.text_cache.render(font, text, color)
 
     def reset_game(self):
-        colors = self.theme_colors
-        self.left_paddle = Paddle(30, HEIGHT//2-45, color=colors["paddle"])
-        self.right_paddle = Paddle(WIDTH-45, HEIGHT//2-45, color=colors["paddle"])
-        self.balls = [Ball(BALL_SPEED, color=colors["ball"])]
-        self.trail = []
-        self.powerups = []
+        self.stop_runner()
+        # Everything random in a match, physics and effects alike, derives from this seed.
+        seed = self.seed if self.seed is not None else random.getrandbits(63)
+        params = dict(DIFFICULTIES[self.difficulty])
+        if self.mode == "Chaos":
+            params.update(CHAOS)
+        self.net_text = ""
+        if self.mode == "Online" and self.net:
+            # Both peers build the same match from the host's seed.
+            seed = self.net.seed
+            self.session = RollbackSession(self.net.side, seed, **params)
+            self.sim = self.session.sim
+            self.net.start(self.session)
+        else:
+            self.session = None
+            self.sim = Simulation(1, WIDTH, HEIGHT, seed=seed, ai=(False, self.mode != "PvP"), record_events=True,
+                                  **params)
+        self.particles.rng = self.confetti.rng = np.random.default_rng(seed)
+        self.recorder = ReplayRecorder(self.sim) if self.record_dir and not (self.session or self.watcher) else None
+        self.replay = None
+        self.view = self.sim
+        self.actions = [(0, 0)]
+        self.accumulator = 0.0
+        self.trails.clear()
         self.active_powerups = {"left": [], "right": []}
 
+    def start_replay(self, player):
+        self.reset_game()
+        self.recorder = None
+        self.replay = player
+        self.sim = self.view = player.sim
+        self.sim.record_events = True
+        self.mode = "Chaos" if player.sim.respawn else "PvAI" if player.sim.ai[0, 1] else "PvP"
+        self.left_score, self.right_score = (int(s) for s in self.sim.score[0])
+        self.state = "game"
+
+    def save_replay(self):
+        if self.recorder and self.recorder.ticks:
+            os.makedirs(self.record_dir, exist_ok=True)
+            name = time.strftime("match-%Y%m%d-%H%M%S.rpl")
+            with self.profiler.span("save replay"):
+                self.recorder.save(os.path.join(self.record_dir, name))
+        self.recorder = None
+
     def create_particles(self, pos, color=None):
         c = color if color else self.theme_colors["particle"]
-        for _ in range(15):
-            self.particles.append(Particle(pos, c))
+        self.particles.burst(pos, c, self.quality["burst"])
 
     def create_confetti(self, pos):
-        for _ in range(35):
-            self.confetti.append(ConfettiParticle(pos))
-
-    def handle_collisions(self):
-        for ball in self.balls:
-            if ball.rect.colliderect(self.left_paddle.rect):
-                ball.rect.left = self.left_paddle.rect.right
-                ball.vel[0] = abs(ball.vel[0]) * 1.07
-                ball.vel[1] += random.uniform(-1, 1)
-                self.create_particles(ball.rect.center)
-                if self.sound_on and self.sound_enabled: self.snd_hit.play()
-            if ball.rect.colliderect(self.right_paddle.rect):
-                ball.rect.right = self.right_paddle.rect.left
-                ball.vel[0] = -abs(ball.vel[0]) * 1.07
-                ball.vel[1] += random.uniform(-1, 1)
-                self.create_particles(ball.rect.center)
-                if self.sound_on and self.sound_enabled: self.snd_hit.play()
-            if ball.rect.top <= 0 or ball.rect.bottom >= HEIGHT:
-                ball.bounce('y')
-                self.create_particles(ball.rect.center)
-            for p in self.powerups[:]:
-                if ball.rect.colliderect(p.rect):
-                    self.apply_powerup(p, ball)
-                    self.powerups.remove(p)
-
-    def apply_powerup(self, p, ball):
-        if p.kind == "Speed":
-            ball.increase_speed(1.5)
-        elif p.kind == "Size":
-            ball.inflate(10)
-        elif p.kind == "MultiBall":
-            if len(self.balls) < 3:
-                for _ in range(2):
-                    new_ball = Ball(BALL_SPEED, color=self.theme_colors["ball"])
-                    new_ball.rect.center = ball.rect.center
-                    self.balls.append(new_ball)
-        self.create_particles(p.rect.center, p.color)
-
-    def maybe_spawn_powerup(self):
-        if random.random() < 0.005 and len(self.powerups) < 2:
-            kind = random.choice(POWERUP_TYPES)
-            x = random.randint(WIDTH//4, WIDTH*3//4)
-            y = random.randint(100, HEIGHT-100)
-            self.powerups.append(PowerUp(pygame.Rect(x, y, 34, 34), kind))
+        with self.profiler.span("confetti burst"):
+            self.confetti.confetti(pos, self.quality["confetti"])
+
+    def render_report(self):
+        dirty = self.dirty
+        return {"mode": "dirty rects" if self.dirty_rendering else "full redraw", "frames": dirty.frames,
+                "pixels_per_frame": round(dirty.total_pixels / max(dirty.frames, 1))}
+
+    def cache_report(self):
+        return {"sprites": self.sprites.stats(), "text": self.text_cache.stats()}
+
+    def overlay_status(self):
+        sprites, text = self.sprites.stats(), self.text_cache.stats()
+        return [self.governor.status(),
+                f"pushed {self.dirty.pixels / 1000:.0f}k px ({self.render_report()['mode']})",
+                f"hits: sprites {sprites['hit_rate']:.0%}  text {text['hit_rate']:.0%}"]
+
+    def object_counts(self):
+        return (int(self.view.ball_alive[0].sum()), len(self.particles) + len(self.confetti),
+                int(self.view.pu_alive[0].sum()))
 
     def handle_input(self):
+        # Returns False once a replay has run out, so no tick is stepped past its end.
+        if self.replay:
+            if self.replay.finished:
+                self.replay = None
+                self.state = "menu"
+                return False
+            self.actions = [self.replay.next_actions()]
+            return True
+        self.actions = self.read_keys()
+        return True
+
+    def read_keys(self):
         keys = pygame.key.get_pressed()
-        if keys[self.controls["left_up"]]:
-            self.left_paddle.move(-self.left_paddle.speed)
-        if keys[self.controls["left_down"]]:
-            self.left_paddle.move(self.left_paddle.speed)
-        if self.mode == "PvP":
-            if keys[self.controls["right_up"]]:
-                self.right_paddle.move(-self.right_paddle.speed)
-            if keys[self.controls["right_down"]]:
-                self.right_paddle.move(self.right_paddle.speed)
-        else:
-            self.handle_ai()
-
-    def handle_ai(self):
-        ball = self.balls[0]
-        target = self._ai_predict_ball_y() if AI_PREDICT else ball.rect.centery
-        dead_zone = 10
-        if abs(self.right_paddle.rect.centery - target) > dead_zone:
-            if random.random() > AI_MISS_CHANCE:
-                move = min(AI_SPEED, abs(self.right_paddle.rect.centery - target))
-                if self.right_paddle.rect.centery < target and self.right_paddle.rect.bottom < HEIGHT:
-                    self.right_paddle.move(move)
-                elif self.right_paddle.rect.centery > target and self.right_paddle.rect.top > 0:
-                    self.right_paddle.move(-move)
-
-    def _ai_predict_ball_y(self):
-        ball = self.balls[0]
-        bx, by = ball.rect.center
-        vx, vy = ball.vel
-        if vx <= 0:
-            return by
-        t = (self.right_paddle.rect.left - bx) / vx
-        predicted_y = by + vy * t
-        while predicted_y < 0 or predicted_y > HEIGHT:
-            if predicted_y < 0:
-                predicted_y = -predicted_y
-            elif predicted_y > HEIGHT:
-                predicted_y = 2*HEIGHT - predicted_y
-        return predicted_y
+        left = keys[self.controls["left_down"]] - keys[self.controls["left_up"]]
+        right = keys[self.controls["right_down"]] - keys[self.controls["right_up"]]
+        return [(left, right)]
+
+    def play_sound(self, name):
+        if self.sound_on and self.sound_enabled:
+            self.sounds.play(name)
+
+    @property
+    def local_side(self):
+        # The side this player's stats count for: the joining peer of an online match plays the right.
+        return self.session.side if self.session else 0
+
+    def handle_events(self, events):
+        bursts = 0
+        for kind, _, pos, data in events:
+            if kind in ("hit", "wall"):
+                if bursts < MAX_BURSTS:
+                    self.create_particles(pos)
+                    bursts += 1
+                self.play_sound(kind)
+            elif kind == "powerup":
+                self.create_particles(pos, data[1])
+                self.play_sound("powerup")
+            elif kind == "score":
+                self.play_sound("score")
+                if self.watcher or self.replay:
+                    continue  # someone else's match
+                if data != self.local_side:
+                    self.achievements.add("Lose a point")
+                else:
+                    self.streak += 1
+                    self.max_streak = max(self.max_streak, self.streak)
+                    if self.streak >= 5:
+                        self.achievements.add("5 streak!")
 
     def update_game(self):
-        for ball in self.balls:
-            ball.move()
-        self.trail.append(self.balls[0].rect.center)
-        if len(self.trail) > 20:
-            self.trail.pop(0)
-        self.maybe_spawn_powerup()
-        scored = False
-        for ball in self.balls[:]:
-            if ball.rect.left <= 0:
-                self.right_score += 1
-                self.achievements.add("Lose a point")
-                scored = True
-                self.balls.remove(ball)
-            elif ball.rect.right >= WIDTH:
-                self.left_score += 1
-                self.streak += 1
-                self.max_streak = max(self.max_streak, self.streak)
-                if self.streak >= 5:
-                    self.achievements.add("5 streak!")
-                scored = True
-                self.balls.remove(ball)
-        if scored:
-            if not self.balls:
-                self.balls = [Ball(BALL_SPEED, color=self.theme_colors["ball"])]
-            self.left_paddle.reset()
-            self.right_paddle.reset()
-        self.particles = [p for p in self.particles if p.update()]
-        self.confetti = [c for c in self.confetti if c.update()]
+        self.sim.step(self.actions)
+        if self.recorder:
+            self.recorder.record(self.sim, self.actions[0])
+        self.apply_tick(self.sim)
+
+    def apply_tick(self, view):
+        # Effects, scores and trails for one simulated tick; view is the
+        # Simulation itself or a Frame published by the simulation thread.
+        if self.broadcaster and not self.watcher:
+            self.broadcaster.publish(view, self.sim.win_score)
+        self.handle_events(view.events)
+        self.left_score, self.right_score = (int(s) for s in view.score[0])
+        # Stamped where the tick started: the ball is drawn somewhere between
+        # there and its new position, so the trail never runs ahead of it.
+        self.trails.stamp(view.ball_rects(0, 0.0), self.theme_colors["ball"])
+        self.active_powerups = {"left": [], "right": []}
+        for name, side, left, duration in view.active_effects(0):
+            self.active_powerups["right" if side else "left"].append((name, left, duration))
+        self.particles.update()
+        self.confetti.update()
+
+    async def connect(self):
+        conditions = self.online.get("conditions", {})
+        if "join" in self.online:
+            self.net = await join_match(self.online["join"], **conditions)
+        else:
+            seed = self.seed if self.seed is not None else random.getrandbits(63)
+            self.net = await host_match(self.online["host"], seed, **conditions)
+        self.mode = "Online"
+        self.state = "game"
+        self.left_score = self.right_score = 0
+        self.reset_game()
 
-    def draw_main_menu(self, t):
+    def update_online(self):
+        # Never waits on the network: the session guesses the opponent's
+        # input and rewinds when it learns otherwise. A skipped tick means
+        # this side is too far ahead of the opponent.
+        left, right = self.actions[0]
+        if self.net.lost:
+            self.leave_online()
+            self.state = "menu"
+            return
+        advanced = self.session.advance(left or right)
+        self.net.send_inputs()
+        if not advanced:
+            return
+        self.apply_tick(self.sim)
+        if self.session.tick % TICK_RATE == 0:
+            report = self.net.report()
+            self.net_text = (f"rollback avg {report['rollback_depth_mean']:.1f} max {report['rollback_depth_max']}  "
+                             f"{report['sent_kbps'] + report['received_kbps']:.0f} kbps")
+        # A point scored on a guess can still be taken back.
+        if self.session.settled:
+            self.check_winner()
+
+    def leave_online(self):
+        if self.net:
+            # The winner screen keeps the match's connection summary.
+            r = self.net.report()
+            self.net_text = (f"online: {r['rollbacks']} rollbacks (avg {r['rollback_depth_mean']:.1f}, "
+                             f"max {r['rollback_depth_max']}), {r['desyncs']} desyncs, "
+                             f"{r['sent_kbps'] + r['received_kbps']:.0f} kbps")
+            self.net.close(LINGER)
+        self.net = None
+        self.session = None
+        self.mode = "PvP"
+
+    def draw_connecting(self):
         c = self.theme_colors
-        self.screen.fill(c["menu_bg"])
-        title_text = self.title_font.render("Ultimate Pong Deluxe", True, c["accent"])
+        self.screen.fill(c["bg"])
+        if "join" in self.online:
+            message = "Connecting to {}:{}...".format(*self.online["join"])
+        else:
+            message = f"Waiting for an opponent on port {self.online['host']}..."
+        txt = self.render_text(self.font, message, c["text"])
+        self.screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2)))
+
+    def update_spectating(self):
+        # Ticks come from the broadcasting game. The tick count going back
+        # means it has started a new match, which ends the winner screen.
+        for frame in self.watcher.frames.drain():
+            if frame.tick[0] < self.view.tick[0]:
+                self.state = "game"
+                self.trails.clear()
+            elif self.state != "game":
+                continue
+            self.view = frame
+            self.apply_tick(frame)
+            self.check_winner()
+
+    def start_runner(self):
+        self.inputs = InputQueue(self.actions)
+        if self.replay:
+            replay = self.replay
+            actions = lambda stamp: [replay.next_actions()]
+            until = lambda: replay.finished
+        else:
+            actions = self.inputs.actions_at
+            until = None
+        recorder = self.recorder
+        on_tick = (lambda a: recorder.record(self.sim, a[0])) if recorder else None
+        self.view = Frame(self.sim, 0, time.perf_counter())
+        self.runner = SimRunner(self.sim, actions, on_tick, until).start()
+
+    def stop_runner(self):
+        if self.runner:
+            self.runner.stop()
+            self.runner = None
+
+    def update_threaded(self):
+        # The frame loop only feeds input in and takes frames out; every tick
+        # published since the last frame gets its effects applied in order.
+        if self.runner is None:
+            self.start_runner()
+        self.runner.paused = self.paused
+        if not self.replay:
+            actions = self.read_keys()
+            if actions != self.actions:
+                self.inputs.push(time.perf_counter(), actions)
+                self.actions = actions
+        frames = self.runner.frames.drain()
+        for frame in frames:
+            self.view = frame
+            self.apply_tick(frame)
+            self.check_winner()
+            if self.state != "game":
+                return
+        if self.replay and self.runner.finished and not frames:
+            self.stop_runner()
+            self.replay = None
+            self.state = "menu"
+
+    def layout_menu(self):
+        # Runs on startup and theme change: positions the buttons and
+        # pre-composites everything on the menu that never changes.
+        c = self.theme_colors
+        background = pygame.Surface((WIDTH, HEIGHT)).convert()
+        background.fill(c["menu_bg"])
+        title_text = self.render_text(self.title_font, "Ultimate Pong Deluxe", c["accent"])
         title_y = 60
-        self.screen.blit(title_text, (60, title_y))
+        background.blit(title_text, (60, title_y))
         divider_y = title_y + title_text.get_height() + 18
-        pygame.draw.line(self.screen, c["accent"], (60, divider_y), (WIDTH-60, divider_y), 2)
+        pygame.draw.line(background, c["accent"], (60, divider_y), (WIDTH-60, divider_y), 2)
         button_width, button_height = 300, 58
         button_gap = 38
         total_height = len(self.menu_buttons) * button_height + (len(self.menu_buttons)-1) * button_gap
@@ -421,22 +582,32 @@ class PongGame:
             button_gap = int(button_gap * scale)
             total_height = len(self.menu_buttons) * button_height + (len(self.menu_buttons)-1) * button_gap
         button_x = WIDTH//2 - button_width//2
-        mouse_pos = pygame.mouse.get_pos()
         for i, button in enumerate(self.menu_buttons):
             button.rect.x = button_x
             button.rect.y = button_y_start + i * (button_height + button_gap)
             button.rect.width = button_width
             button.rect.height = button_height
+            button.invalidate()
+        info_text = self.render_text(self.font, "First to 10 wins. W/S and ↑/↓ to move.", c["text"])
+        background.blit(info_text, (WIDTH//2 - info_text.get_width()//2, HEIGHT - 90))
+        self.menu_background = background
+
+    def draw_main_menu(self, t):
+        c = self.theme_colors
+        if self.menu_background is None:
+            with self.profiler.span("layout menu"):
+                self.layout_menu()
+        self.screen.blit(self.menu_background, (0, 0))
+        mouse_pos = self.viewport.to_logical(pygame.mouse.get_pos())
+        alpha = min(255, int(self.menu_alpha))
+        for i, button in enumerate(self.menu_buttons):
             button.hovered = button.rect.collidepoint(mouse_pos)
             button.selected = (i == self.menu_selected)
-            alpha = min(255, int(self.menu_alpha))
             button.draw(self.screen, self.font, c, alpha=alpha)
-        info_text = self.font.render("First to 10 wins. W/S and ↑/↓ to move.", True, c["text"])
-        self.screen.blit(info_text, (WIDTH//2 - info_text.get_width()//2, HEIGHT - 90))
-        stats_font = pygame.font.Font(None, 28)
-        stats = stats_font.render(
+        stats = self.render_text(
+            self.small_font,
             f"Games: {self.stats['games']}  Wins: {self.stats['wins']}  Losses: {self.stats['losses']}  Max Streak: {self.max_streak}",
-            True, c["button_hover"])
+            c["button_hover"])
         self.screen.blit(stats, (WIDTH//2 - stats.get_width()//2, HEIGHT - 52))
         if self.menu_fade_in and self.menu_alpha < 255:
             self.menu_alpha += 8
@@ -453,85 +624,172 @@ class PongGame:
             "W/S: Move left paddle",
             "Up/Down: Move right paddle (PvP)",
             "P: Pause",
+            "F3: Frame profiler",
             "SPACE: Return to menu after a game",
             "Click 'Switch Theme' for Light/Dark mode",
-            "Power-ups: S=Speed, Z=Size, M=MultiBall",
+            "Power-ups: " + ", ".join(f"{spec['label']}={name}" for name, spec in POWERUPS.items()),
             "First to 10 points wins.",
             "Achievements unlock for streaks and more!",
             "Navigate menu: ↑/↓ or W/S, Enter to select"
         ]
         for i, line in enumerate(lines):
-            txt = self.font.render(line, True, c["text"])
+            txt = self.render_text(self.font, line, c["text"])
             self.screen.blit(txt, (WIDTH//2 - txt.get_width()//2, 120 + i*40))
 
-    def draw_game(self):
+    def draw_game(self, alpha=1.0):
         c = self.theme_colors
-        self.screen.fill(c["bg"])
-        for i, pos in enumerate(self.trail):
-            alpha = int(255 * (i+1) / len(self.trail))
-            trail_color = (c["ball"][0], c["ball"][1], c["ball"][2], alpha)
-            s = pygame.Surface((20, 20), pygame.SRCALPHA)
-            pygame.draw.ellipse(s, trail_color, (0,0,20,20))
-            self.screen.blit(s, (pos[0]-10, pos[1]-10))
-        self.left_paddle.draw(self.screen, c["paddle"])
-        self.right_paddle.draw(self.screen, c["paddle"])
-        for ball in self.balls:
-            ball.draw(self.screen, c["ball"])
-        for p in self.particles:
-            surf = pygame.Surface((6,6), pygame.SRCALPHA)
-            color = p.color + (p.alpha,)
-            pygame.draw.circle(surf, color, (3,3), 3)
-            self.screen.blit(surf, (int(p.pos[0]), int(p.pos[1])))
-        for p in self.powerups:
-            p.draw(self.screen)
-        score_text = self.big_font.render(f"{self.left_score} - {self.right_score}", True, c["text"])
+        dirty = self.dirty
+        if dirty.full:
+            self.screen.fill(c["bg"])
+        else:
+            dirty.restore(self.screen, c["bg"])
+        dirty.add(self.trails.draw(self.screen))
+        view = self.view
+        rounded = self.quality["rounded"]
+        for rect in view.paddle_rects(0, alpha):
+            dirty.add(pygame.draw.rect(self.screen, c["paddle"], rect, border_radius=8 if rounded else 0))
+        balls = view.ball_rects(0, alpha)
+        sprites = ball_sprites(self.sprites, balls, c["ball"])
+        dirty.add_all(self.screen.blits([(sprites[w], (x, y)) for x, y, w, h in balls]))
+        dirty.add(self.particles.draw(self.screen))
+        for kind, rect, color in view.powerup_items(0):
+            dirty.add(pygame.draw.rect(self.screen, color, rect, border_radius=10 if rounded else 0))
+            txt = self.render_text(self.small_font, POWERUPS[kind]["label"], (0, 0, 0))
+            self.screen.blit(txt, (rect[0] + 7, rect[1] + 7))
+        score_text = self.render_text(self.big_font, f"{self.left_score} - {self.right_score}", c["text"])
         score_rect = score_text.get_rect(center=(WIDTH//2, 50))
-        self.screen.blit(score_text, score_rect)
+        dirty.add(self.screen.blit(score_text, score_rect))
+        self.draw_active_powerups(score_rect)
         if self.paused:
             overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
             overlay.fill((c["paused"][0], c["paused"][1], c["paused"][2], 120))
             self.screen.blit(overlay, (0,0))
-            pause_text = self.big_font.render("PAUSED", True, c["text"])
+            pause_text = self.render_text(self.big_font, "PAUSED", c["text"])
             pause_rect = pause_text.get_rect(center=(WIDTH//2, HEIGHT//2))
             self.screen.blit(pause_text, pause_rect)
         if self.achievements:
-            ach = self.font.render("Achievements: " + ", ".join(self.achievements), True, c["accent"])
-            self.screen.blit(ach, (20, HEIGHT-40))
+            ach = self.render_text(self.font, "Achievements: " + ", ".join(self.achievements), c["accent"])
+            dirty.add(self.screen.blit(ach, (20, HEIGHT-40)))
+        if self.session and self.net_text:
+            txt = self.render_text(self.small_font, self.net_text, c["text"])
+            dirty.add(self.screen.blit(txt, (WIDTH - txt.get_width() - 20, 20)))
+
+    def draw_active_powerups(self, score_rect):
+        # Each side's timed effects beside the score: a label and a bar that
+        # runs down with the time left.
+        for side, effects in enumerate(self.active_powerups.values()):
+            for i, (name, left, duration) in enumerate(effects):
+                spec = POWERUPS[name]
+                x = score_rect.left - 80 - i * 70 if side == 0 else score_rect.right + 20 + i * 70
+                label = self.render_text(self.small_font, spec["label"], spec["color"])
+                self.dirty.add(self.screen.blit(label, (x, score_rect.centery - 20)))
+                bar = (x, score_rect.centery + 12, max(1, 60 * min(left, duration) // duration), 6)
+                self.dirty.add(pygame.draw.rect(self.screen, spec["color"], bar))
+
+    def resize_window(self, size):
+        # Only the presentation scale changes; the match and the layout keep
+        # their logical geometry.
+        self.window = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self.viewport.resize(self.window)
+        self.screen = self.viewport.canvas
+        self.dirty.invalidate()
+
+    def present(self):
+        # Only the unobstructed game screen tracks dirty rects; menus and
+        # overlays flip the whole window and force a full repaint afterwards.
+        full = self.state != "game" or self.paused or self.show_help or not self.dirty_rendering
+        if full:
+            self.dirty.invalidate()
+        self.dirty.present(self.screen, self.viewport)
+        if full:
+            self.dirty.invalidate()
 
     def draw_winner(self):
         c = self.theme_colors
         self.screen.fill(c["bg"])
-        win_text = self.big_font.render(f"{self.winner} Wins!", True, c["accent"])
+        win_text = self.render_text(self.big_font, f"{self.winner} Wins!", c["accent"])
         win_rect = win_text.get_rect(center=(WIDTH//2, HEIGHT//2-40))
         self.screen.blit(win_text, win_rect)
-        info_text = self.font.render("Press SPACE to return to menu.", True, c["text"])
+        info_text = self.render_text(self.font, "Press SPACE to return to menu.", c["text"])
         info_rect = info_text.get_rect(center=(WIDTH//2, HEIGHT//2+40))
         self.screen.blit(info_text, info_rect)
         if self.achievements:
-            ach = self.font.render("Achievements: " + ", ".join(self.achievements), True, c["accent"])
+            ach = self.render_text(self.font, "Achievements: " + ", ".join(self.achievements), c["accent"])
             self.screen.blit(ach, (20, HEIGHT-40))
-        for conf in self.confetti:
-            surf = pygame.Surface((8,8), pygame.SRCALPHA)
-            color = conf.color + (conf.alpha,)
-            pygame.draw.circle(surf, color, (4,4), 4)
-            self.screen.blit(surf, (int(conf.pos[0]), int(conf.pos[1])))
+        if self.net_text:
+            txt = self.render_text(self.small_font, self.net_text, c["text"])
+            self.screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2+80)))
+        self.confetti.draw(self.screen)
+
+    def check_winner(self):
+        win_score = self.watcher.world.win_score if self.watcher else self.sim.win_score
+        if self.left_score < win_score and self.right_score < win_score:
+            return
+        self.stop_runner()
+        self.save_replay()
+        self.winner = "Left" if self.left_score >= win_score else "Right"
+        if self.replay is None and not self.watcher:
+            self.store.record({
+                "time": int(time.time()), "mode": self.mode, "difficulty": self.difficulty,
+                "seed": int(self.sim.seed[0]), "side": ("Left", "Right")[self.local_side], "winner": self.winner,
+                "score": [self.left_score, self.right_score],
+                "ticks": int(self.view.tick[0]), "max_streak": self.max_streak,
+                "achievements": sorted(self.achievements),
+            })
+        self.state = "winner"
+        if self.session:
+            self.leave_online()
+        self.streak = 0
+        self.create_confetti((WIDTH//2, HEIGHT//2-40))
+        self.play_sound("win")
 
     async def run(self):
         t = 0
+        last_time = time.perf_counter()
+        prof = self.profiler
+        first_frame = True
+        self.persistence.schedule()
+        if self.spectate:
+            self.watcher = await watch(self.spectate)
+            self.reset_game()
+            self.state = "game"
+        if self.online:
+            self.state = "connecting"
+            self.connecting = asyncio.get_running_loop().create_task(self.connect())
         while True:
+            prof.begin_frame()
+            now = time.perf_counter()
+            frame_time = min(now - last_time, MAX_FRAME_TIME)
+            last_time = now
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.stop_runner()
+                    if self.session:
+                        self.leave_online()
+                    if self.broadcaster:
+                        self.broadcaster.close()
+                    if self.watcher:
+                        self.watcher.close()
+                    if self.video:
+                        video = self.video.close()
+                        print("\n".join(self.video.lines(video)))
+                    self.save_replay()
                     self.save_config()
+                    self.store.update(self.max_streak)
+                    self.persistence.flush()
+                    if self.trace_path:
+                        extra = {"quality": self.governor.report(), "render": self.render_report(),
+                                 "caches": self.cache_report()}
+                        if self.video:
+                            extra["video"] = video
+                        prof.export(self.trace_path, extra)
                     pygame.quit()
                     sys.exit()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    prof.toggle_overlay()
+                    self.dirty.invalidate()
                 if event.type == pygame.VIDEORESIZE:
-                    global WIDTH, HEIGHT
-                    WIDTH, HEIGHT = event.w, event.h
-                    self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
-                    self.left_paddle.reset()
-                    self.right_paddle.reset()
-                    for ball in self.balls:
-                        ball.reset(BALL_SPEED)
+                    self.resize_window((event.w, event.h))
                 if self.state == "menu":
                     if event.type == pygame.KEYDOWN:
                         if event.key in (pygame.K_DOWN, pygame.K_s):
@@ -542,10 +800,10 @@ class PongGame:
                             self.menu_fade_in = True
                             self.menu_alpha = 0
                             self.menu_buttons[self.menu_selected].hovered = True
-                            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, {'pos': self.menu_buttons[self.menu_selected].rect.center}))
+                            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, {'pos': self.viewport.to_window(self.menu_buttons[self.menu_selected].rect.center)}))
                     if event.type == pygame.MOUSEBUTTONDOWN:
                         for idx, button in enumerate(self.menu_buttons):
-                            if button.rect.collidepoint(event.pos):
+                            if button.rect.collidepoint(self.viewport.to_logical(event.pos)):
                                 self.menu_selected = idx
                                 if button.text == "Player vs AI":
                                     self.mode = "PvAI"
@@ -557,16 +815,22 @@ class PongGame:
                                     self.state = "game"
                                     self.left_score = self.right_score = 0
                                     self.reset_game()
+                                elif button.text == "Chaos Mode":
+                                    self.mode = "Chaos"
+                                    self.state = "game"
+                                    self.left_score = self.right_score = 0
+                                    self.reset_game()
                                 elif button.text == "Switch Theme":
-                                    self.theme = "Light" if self.theme == "Dark" else "Dark"
-                                    self.theme_colors = THEMES[self.theme]
+                                    self.set_theme("Light" if self.theme == "Dark" else "Dark")
                                     self.reset_game()
                                 elif button.text == "Colorblind Mode":
-                                    self.theme = "Colorblind"
-                                    self.theme_colors = THEMES[self.theme]
+                                    self.set_theme("Colorblind")
                                     self.reset_game()
                                 elif button.text == "Toggle Sound":
                                     self.sound_on = not self.sound_on
+                                elif button.text.startswith("AI: "):
+                                    names = list(DIFFICULTIES)
+                                    self.set_difficulty(names[(names.index(self.difficulty) + 1) % len(names)])
                                 elif button.text == "Show Help":
                                     self.show_help = not self.show_help
                                 self.save_config()
@@ -574,7 +838,7 @@ class PongGame:
                         self.menu_alpha = min(255, self.menu_alpha + 8)
                         if self.menu_alpha >= 255:
                             self.menu_fade_in = False
-                elif self.state == "winner":
+                elif self.state == "winner" and not self.watcher:
                     if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                         self.state = "menu"
                         self.menu_fade_in = True
@@ -584,42 +848,110 @@ class PongGame:
                         self.paused = not self.paused
                     if event.type == pygame.KEYDOWN and event.key == pygame.K_h:
                         self.show_help = not self.show_help
+            prof.mark("events")
 
             if self.state == "menu":
                 self.draw_main_menu(t)
                 if self.show_help:
                     self.draw_help()
+            elif self.state == "connecting":
+                if self.connecting.done():
+                    # connect() leaves this state unless it failed.
+                    print(f"online match failed: {self.connecting.exception()!r}")
+                    self.online = None
+                    self.state = "menu"
+                else:
+                    self.draw_connecting()
+            elif self.state == "game" and (self.threaded or self.watcher) and not self.session:
+                if self.watcher:
+                    self.update_spectating()
+                else:
+                    self.update_threaded()
+                prof.mark("update")
+                alpha = 1.0 if self.paused else (time.perf_counter() - self.view.time) / TICK
+                self.draw_game(min(1.0, alpha))
+                if self.show_help:
+                    self.draw_help()
             elif self.state == "game":
-                if not self.paused:
-                    self.handle_input()
-                    self.handle_collisions()
-                    self.update_game()
-                self.draw_game()
+                # Physics advances in fixed ticks; rendering interpolates between them.
+                self.accumulator = 0.0 if self.paused else self.accumulator + frame_time
+                while self.accumulator >= TICK and self.state == "game":
+                    if not self.handle_input():
+                        break
+                    prof.mark("input")
+                    if self.session:
+                        self.update_online()
+                    else:
+                        self.update_game()
+                        self.check_winner()
+                    prof.mark("update")
+                    self.accumulator -= TICK
+                self.draw_game(min(1.0, self.accumulator / TICK))
                 if self.show_help:
                     self.draw_help()
-                if self.left_score >= WIN_SCORE:
-                    self.winner = "Left"
-                    self.stats["games"] += 1
-                    self.stats["wins"] += 1
-                    self.state = "winner"
-                    self.streak = 0
-                    self.create_confetti((WIDTH//2, HEIGHT//2-40))
-                elif self.right_score >= WIN_SCORE:
-                    self.winner = "Right"
-                    self.stats["games"] += 1
-                    self.stats["losses"] += 1
-                    self.state = "winner"
-                    self.streak = 0
-                    self.create_confetti((WIDTH//2, HEIGHT//2-40))
             elif self.state == "winner":
+                if self.watcher:
+                    self.update_spectating()
                 self.draw_winner()
-
-            pygame.display.flip()
+            prof.mark("draw")
+            if prof.overlay:
+                text = lambda s: self.render_text(self.small_font, s, (255, 255, 255))
+                self.dirty.add(prof.draw_overlay(self.screen, text, status=self.overlay_status()))
+                prof.mark("overlay")
+
+            self.present()
+            if self.video:
+                with prof.span("capture"):
+                    self.video.capture(self.screen)
+            prof.mark("present")
+            if first_frame:
+                first_frame = False
+                self.startup.mark("first frame")
+                if self.startup_report:
+                    print("\n".join(self.startup.lines()))
+            self.governor.frame(time.perf_counter() - now)
             self.clock.tick(FPS)
+            prof.mark("wait")
+            prof.end_frame(self.object_counts)
             t += 0.05
             await asyncio.sleep(0)
 
 if __name__ == "__main__":
-    pygame.init()
-    game = PongGame()
+    parser = argparse.ArgumentParser(description="Ultimate Pong Deluxe")
+    parser.add_argument("--seed", type=int, help="fixed seed for every match")
+    parser.add_argument("--record", metavar="DIR", help="save a replay of each match to DIR")
+    parser.add_argument("--profile", action="store_true", help="show the frame profiler overlay (toggle with F3)")
+    parser.add_argument("--trace", metavar="PATH", help="write a Chrome trace of the last frames on exit")
+    parser.add_argument("--startup-report", action="store_true", help="print where launch time went")
+    parser.add_argument("--sim-thread", action="store_true", help="run the simulation on its own thread")
+    parser.add_argument("--host", type=int, metavar="PORT", help="host an online match on PORT")
+    parser.add_argument("--join", metavar="HOST:PORT", help="join an online match")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated one-way network delay, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulated delay variation, ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated fraction of lost packets")
+    parser.add_argument("--broadcast", type=int, metavar="PORT", help="stream matches to spectators on PORT")
+    parser.add_argument("--watch", metavar="HOST:PORT", help="spectate a broadcasting game")
+    parser.add_argument("--capture", metavar="PATH",
+                        help="record the game to PATH: a .y4m video, or otherwise a folder of PNG frames")
+    parser.add_argument("--capture-fps", type=int, default=FPS, help="frames per second to record")
+    parser.add_argument("--quality", choices=["auto"] + QUALITY_NAMES, default="auto",
+                        help="effects quality; auto adapts it to hold the frame rate")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="push the whole window every frame instead of only what changed")
+    args = parser.parse_args()
+    online = None
+    if args.host is not None or args.join:
+        online = {"join": parse_address(args.join)} if args.join else {"host": args.host}
+        online["conditions"] = {"latency": args.latency / 1000, "jitter": args.jitter / 1000, "loss": args.loss}
+    startup = StartupReport(START_TIME)
+    startup.mark("imports")
+    # The mixer is opened in the background by PongGame, not here.
+    pygame.display.init()
+    pygame.font.init()
+    startup.mark("pygame init")
+    game = PongGame(seed=args.seed, record_dir=args.record, profile=args.profile, trace_path=args.trace,
+                    startup=startup, startup_report=args.startup_report, sim_thread=args.sim_thread,
+                    online=online, broadcast_port=args.broadcast,
+                    spectate=parse_address(args.watch) if args.watch else None, quality=args.quality,
+                    capture=args.capture, capture_fps=args.capture_fps, full_redraw=args.full_redraw)
     asyncio.run(game.run())
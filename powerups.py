@@ -0,0 +1,64 @@
+import heapq
+import numpy as np
+
+# Every power-up, shared by the simulation and the renderer. The order fixes
+# each kind's index in saved state, replays and broadcasts, so new kinds go
+# at the end.
+#   label, color: how it is drawn on the court and in the HUD
+#   weight:       relative chance of being the one that spawns
+#   target:       "self" for the side that sent the ball into it, "opponent"
+#                 for the other side, "ball" for an instant effect on play
+#   stat, op, amount: the per-side stat changed while the effect lasts
+#   duration:     seconds
+#   stacking:     collecting it again while active "refresh"es the timer,
+#                 "extend"s it by another duration, or "stack"s another copy
+#                 (up to max_stacks, then the copy closest to expiring is refreshed)
+POWERUPS = {
+    "Speed": {"label": "S", "color": (255, 200, 60), "weight": 1.0, "target": "self",
+              "stat": "paddle_speed", "op": "mul", "amount": 1.5, "duration": 8.0, "stacking": "refresh"},
+    "Size": {"label": "+", "color": (120, 220, 120), "weight": 1.0, "target": "self",
+             "stat": "paddle_h", "op": "add", "amount": 30, "duration": 10.0, "stacking": "stack",
+             "max_stacks": 2},
+    "MultiBall": {"label": "M", "color": (90, 160, 255), "weight": 1.0, "target": "ball"},
+    "Shrink": {"label": "-", "color": (255, 120, 120), "weight": 0.5, "target": "opponent",
+               "stat": "paddle_h", "op": "add", "amount": -30, "duration": 6.0, "stacking": "extend"},
+}
+POWERUP_SPECS = list(POWERUPS.values())
+MAX_EFFECTS = 8      # timed effects active at once in one match
+
+
+def spawn_gap(u, chance):
+    # Ticks until the next spawn for a per-tick spawn chance: one geometric
+    # draw per spawn instead of a roll every tick. u is uniform in [0, 1).
+    if chance <= 0:
+        return np.full(np.shape(u), 2 ** 62, dtype=np.uint64)
+    if chance >= 1:
+        return np.ones(np.shape(u), dtype=np.uint64)
+    return (1 + np.floor(np.log1p(-u) / np.log1p(-chance))).astype(np.uint64)
+
+
+class ExpiryQueue:
+    # Min-heap of timed effect expiries for a whole batch of matches. Every
+    # live match ticks once per step, so a single step clock orders all of
+    # them and a step with nothing due costs one comparison. Entries are not
+    # removed when an effect is refreshed or cleared; the caller checks each
+    # popped entry against the effect's current expiry tick.
+    def __init__(self):
+        self.heap = []
+        self.clock = 0
+
+    def push(self, ticks, n, slot, until):
+        heapq.heappush(self.heap, (self.clock + ticks, n, slot, until))
+
+    def rebuild(self, entries):
+        # entries: (ticks from now, match, slot, expiry tick)
+        self.heap = [(self.clock + ticks, n, slot, until) for ticks, n, slot, until in entries]
+        heapq.heapify(self.heap)
+
+    def advance(self):
+        # Moves the clock on one step and returns the entries now due.
+        self.clock += 1
+        due = []
+        while self.heap and self.heap[0][0] <= self.clock:
+            due.append(heapq.heappop(self.heap)[1:])
+        return due
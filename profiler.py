@@ -0,0 +1,200 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import pygame
+
+# Frame phases, in the order PongGame.run goes through them.
+PHASES = ["events", "input", "update", "draw", "overlay", "present", "wait"]
+PHASE_COLORS = [(90, 160, 255), (255, 200, 60), (120, 220, 120), (255, 120, 120),
+                (180, 180, 180), (200, 120, 255), (70, 70, 90)]
+COUNTERS = ["balls", "particles", "powerups"]
+GRAPH_FRAMES = 120
+BUDGET_MS = 1000 / 60
+NULL_SPAN = nullcontext()
+
+
+def _noop(*args):
+    pass
+
+
+class Profiler:
+    # Per-frame phase timings in fixed-size ring buffers. While disabled the
+    # recording methods are swapped for a no-op, so instrumented code pays one
+    # empty call per mark.
+    def __init__(self, capacity=600, enabled=False, span_capacity=8192):
+        self.capacity = capacity
+        self.names = list(PHASES)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.frame_ms = np.zeros((capacity, len(PHASES)))
+        self.frame_start = np.zeros(capacity)
+        self.counts = np.zeros((capacity, len(COUNTERS)), dtype=np.int64)
+        self.frames = 0
+        # Every timed interval, phase or ad-hoc span, for trace export.
+        self.span_capacity = span_capacity
+        self.span_id = np.zeros(span_capacity, dtype=np.int32)
+        self.span_start = np.zeros(span_capacity)
+        self.span_dur = np.zeros(span_capacity)
+        self.spans = 0
+        self.origin = time.perf_counter()
+        self.last = self.origin
+        self.overlay = False
+        self.panel = None
+        self.enable(enabled)
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.begin_frame = self._begin_frame if enabled else _noop
+        self.mark = self._mark if enabled else _noop
+        self.end_frame = self._end_frame if enabled else _noop
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.enable()
+
+    def _id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def _record(self, i, start, end):
+        k = self.spans % self.span_capacity
+        self.span_id[k] = i
+        self.span_start[k] = start
+        self.span_dur[k] = end - start
+        self.spans += 1
+
+    def _begin_frame(self):
+        row = self.frames % self.capacity
+        self.frame_ms[row] = 0
+        self.last = self.frame_start[row] = time.perf_counter()
+
+    def _mark(self, phase):
+        # Charges the time since the previous mark to phase; a phase can be
+        # marked several times a frame (one per physics tick) and accumulates.
+        now = time.perf_counter()
+        i = self.ids[phase]
+        self.frame_ms[self.frames % self.capacity, i] += (now - self.last) * 1000
+        self._record(i, self.last, now)
+        self.last = now
+
+    def _end_frame(self, counts=None):
+        if counts is not None:
+            self.counts[self.frames % self.capacity] = counts()
+        self.frames += 1
+
+    def span(self, name):
+        # Times an arbitrary block (a font load, a confetti burst) for the trace.
+        return self._span(name) if self.enabled else NULL_SPAN
+
+    @contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(self._id(name), start, time.perf_counter())
+
+    def recent(self, frames=None):
+        # The last `frames` rows of the frame ring, oldest first.
+        n = min(self.frames, self.capacity, frames or self.capacity)
+        rows = np.arange(self.frames - n, self.frames) % self.capacity
+        return self.frame_ms[rows], self.counts[rows]
+
+    def summary(self):
+        phases, _ = self.recent()
+        if not len(phases):
+            return {}
+        total = phases.sum(axis=1)
+        result = {"frames": int(len(total))}
+        for name, column in zip(["frame"] + PHASES, [total] + list(phases.T)):
+            p50, p95, p99 = np.percentile(column, [50, 95, 99])
+            result[name] = {"mean_ms": round(float(column.mean()), 4), "p50_ms": round(float(p50), 4),
+                            "p95_ms": round(float(p95), 4), "p99_ms": round(float(p99), 4),
+                            "max_ms": round(float(column.max()), 4)}
+        return result
+
+    def export(self, path, extra=None):
+        # Chrome trace format; open in chrome://tracing or ui.perfetto.dev.
+        # `extra` is added to the summary in otherData.
+        n = min(self.spans, self.span_capacity)
+        order = np.arange(self.spans - n, self.spans) % self.span_capacity
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "main"}}]
+        for i, start, dur in zip(self.span_id[order].tolist(), self.span_start[order].tolist(),
+                                 self.span_dur[order].tolist()):
+            events.append({"name": self.names[i], "cat": "phase" if i < len(PHASES) else "span", "ph": "X",
+                           "ts": round((start - self.origin) * 1e6, 1), "dur": round(dur * 1e6, 1),
+                           "pid": 1, "tid": 1})
+        m = min(self.frames, self.capacity)
+        for row in np.arange(self.frames - m, self.frames) % self.capacity:
+            events.append({"name": "objects", "ph": "C", "pid": 1, "tid": 1,
+                           "ts": round((self.frame_start[row] - self.origin) * 1e6, 1),
+                           "args": dict(zip(COUNTERS, self.counts[row].tolist()))})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {**self.summary(), **(extra or {})}}, f)
+
+    def draw_overlay(self, surface, text, pos=(10, 10), size=(360, 170), status=()):
+        # Stacked per-phase frame-time graph over the last GRAPH_FRAMES frames,
+        # with a line at the 60 FPS budget. The text, plus any status lines,
+        # is refreshed every 15 frames so it does not churn the text cache.
+        x, y = pos
+        w, h = size
+        h += 24 * len(status)
+        graph_h = h - 70 - 24 * len(status)
+        if self.panel is None or self.frames % 15 == 0:
+            phases, counts = self.recent(GRAPH_FRAMES)
+            # Time spent waiting for the next frame is graphed but not counted as work.
+            work = phases[:, :-1].sum(axis=1) if len(phases) else np.zeros(1)
+            lines = [f"work {np.median(work):.1f} ms  p95 {np.percentile(work, 95):.1f}  max {work.max():.1f}"]
+            if len(counts):
+                lines.append("  ".join(f"{name} {v}" for name, v in zip(COUNTERS, counts[-1].tolist())))
+            lines.extend(status)
+            self.panel = [text(line) for line in lines]
+        overlay = pygame.Surface((w, h), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        phases, _ = self.recent(GRAPH_FRAMES)
+        scale = graph_h / (2 * BUDGET_MS)
+        bottom = graph_h + 5
+        if len(phases) > 1:
+            xs = np.linspace(5, w - 5, len(phases))
+            stacked = np.minimum(np.cumsum(phases, axis=1) * scale, graph_h)
+            for i in range(len(PHASES) - 1, -1, -1):
+                points = list(zip(xs.tolist(), (bottom - stacked[:, i]).tolist()))
+                pygame.draw.lines(overlay, PHASE_COLORS[i], False, points)
+        budget_y = bottom - BUDGET_MS * scale
+        pygame.draw.line(overlay, (255, 255, 255), (5, budget_y), (w - 5, budget_y))
+        for i, line in enumerate(self.panel):
+            overlay.blit(line, (5, graph_h + 12 + i * 24))
+        return surface.blit(overlay, (x, y))
+
+
+class StartupReport:
+    # Wall-clock checkpoints from process start to the first menu frame, plus
+    # work finished in the background (like opening the audio device).
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = []
+        self.background = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def finished(self, name, seconds):
+        self.background.append((name, seconds))
+
+    def lines(self):
+        total = self.last - self.start
+        lines = [f"startup: first frame after {total * 1000:.1f} ms"]
+        for name, seconds in self.phases:
+            share = seconds / total if total else 0.0
+            lines.append(f"  {name:22} {seconds * 1000:8.1f} ms  {share:6.1%}")
+        for name, seconds in self.background:
+            lines.append(f"  {name + ' (background)':22} {seconds * 1000:8.1f} ms")
+        return lines
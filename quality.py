@@ -0,0 +1,88 @@
+import time
+from collections import deque
+import numpy as np
+
+# Effect settings from full quality down. Each step first gives up what costs
+# the most per frame for the least visible difference. "trail" scales the
+# theme's trail length (0 turns trails off).
+QUALITY_LEVELS = [
+    {"name": "full", "burst": 15, "confetti": 35, "trail": 1.0, "alpha": True, "rounded": True},
+    {"name": "high", "burst": 10, "confetti": 25, "trail": 1.0, "alpha": True, "rounded": True},
+    {"name": "medium", "burst": 6, "confetti": 15, "trail": 0.5, "alpha": True, "rounded": False},
+    {"name": "low", "burst": 3, "confetti": 10, "trail": 0.0, "alpha": False, "rounded": False},
+    {"name": "minimal", "burst": 0, "confetti": 5, "trail": 0.0, "alpha": False, "rounded": False},
+]
+QUALITY_NAMES = [level["name"] for level in QUALITY_LEVELS]
+DEGRADE_AT = 0.9    # share of the frame budget used by the 90th percentile frame
+RESTORE_AT = 0.6
+PATIENCE = 2        # calm windows before stepping back up
+MAX_PATIENCE = 16
+
+
+class QualityGovernor:
+    # Watches frame work time (everything but waiting for the next frame) in
+    # windows of `window` frames and moves one level at a time: down as soon
+    # as a window runs over budget, up only after headroom has lasted
+    # `patience` windows. A step up that is undone by the very next window
+    # doubles the patience, so a scene at the edge does not flicker; it goes
+    # back to normal once a step up has held for MAX_PATIENCE windows.
+    def __init__(self, budget, window=30, level=0, locked=False, on_change=None):
+        self.budget = budget
+        self.window = window
+        self.times = np.zeros(window)
+        self.frames = 0
+        self.level = level
+        self.locked = locked
+        self.on_change = on_change
+        self.calm = 0
+        self.patience = PATIENCE
+        self.raised_at = None
+        self.load = 0.0
+        self.start = time.perf_counter()
+        self.decisions = deque(maxlen=64)
+
+    @property
+    def settings(self):
+        return QUALITY_LEVELS[self.level]
+
+    def frame(self, seconds):
+        self.times[self.frames % self.window] = seconds
+        self.frames += 1
+        if self.frames % self.window:
+            return
+        self.load = float(np.percentile(self.times, 90)) / self.budget
+        if self.locked:
+            return
+        if self.raised_at is not None and self.frames - self.raised_at >= MAX_PATIENCE * self.window:
+            self.raised_at, self.patience = None, PATIENCE  # the last step up has held; trust the scene again
+        if self.load > DEGRADE_AT and self.level < len(QUALITY_LEVELS) - 1:
+            if self.raised_at == self.frames - self.window:
+                self.patience = min(self.patience * 2, MAX_PATIENCE)
+            self.calm = 0
+            self.raised_at = None
+            self._set(self.level + 1, "over budget")
+        elif self.load < RESTORE_AT and self.level > 0:
+            self.calm += 1
+            if self.calm >= self.patience:
+                self.calm = 0
+                self.raised_at = self.frames
+                self._set(self.level - 1, "headroom")
+        else:
+            self.calm = 0
+
+    def _set(self, level, reason):
+        self.decisions.append({
+            "t": round(time.perf_counter() - self.start, 2), "frame": self.frames,
+            "from": QUALITY_NAMES[self.level], "to": QUALITY_NAMES[level], "reason": reason,
+            "p90_load": round(self.load, 2),
+        })
+        self.level = level
+        if self.on_change:
+            self.on_change(self.settings)
+
+    def status(self):
+        return f"quality {self.settings['name']}{' (locked)' if self.locked else ''}  load {self.load:.0%}"
+
+    def report(self):
+        return {"level": self.level, "name": self.settings["name"], "locked": self.locked, "load": self.load,
+                "patience": self.patience, "decisions": list(self.decisions)}
@@ -0,0 +1,335 @@
+import json
+import math
+import os
+from collections import OrderedDict, deque
+import numpy as np
+import pygame
+
+
+class SpriteCache:
+    # Bounded LRU of small pre-rendered alpha sprites keyed by
+    # (shape, radius, colour, quantised alpha).
+    def __init__(self, capacity=2048, alpha_levels=16):
+        self.capacity = capacity
+        self.alpha_levels = alpha_levels
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def quantize(self, alpha):
+        step = self.alpha_levels - 1
+        return max(0, min(step, int(alpha) * step // 255)) * 255 // step
+
+    def get(self, shape, radius, color, alpha=255):
+        key = (shape, radius, tuple(color[:3]), self.quantize(alpha))
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+        self.misses += 1
+        sprite = self._render(*key)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.capacity:
+            self.sprites.popitem(last=False)
+            self.evictions += 1
+        return sprite
+
+    def _render(self, shape, radius, color, alpha):
+        size = 2 * radius
+        if shape == "square":
+            # Opaque, without per-pixel alpha: the cheapest sprite to blit.
+            sprite = pygame.Surface((size, size))
+            sprite.fill(color)
+            return sprite.convert() if pygame.display.get_surface() is not None else sprite
+        sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+        if shape == "circle":
+            pygame.draw.circle(sprite, color + (alpha,), (radius, radius), radius)
+        elif shape == "ellipse":
+            pygame.draw.ellipse(sprite, color + (alpha,), (0, 0, size, size))
+        elif shape == "rect":
+            sprite.fill(color + (alpha,))
+        else:
+            raise ValueError(f"Unknown sprite shape: {shape}")
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()
+        return sprite
+
+    def clear(self):
+        self.evictions += len(self.sprites)
+        self.sprites.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.sprites),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class FontRegistry:
+    # Loads each (face, size, bold) once. face is a comma separated SysFont
+    # list, or None for pygame's default font. The file each face list
+    # resolves to is remembered in cache_path, so later launches open it
+    # directly instead of scanning the system fonts again.
+    def __init__(self, profiler=None, cache_path=None, persistence=None):
+        self.fonts = {}
+        self.profiler = profiler
+        self.cache_path = cache_path
+        self.persistence = persistence
+        self.paths = {}
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    self.paths = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def get(self, face, size, bold=False):
+        key = (face, size, bold)
+        font = self.fonts.get(key)
+        if font is None:
+            if self.profiler:
+                with self.profiler.span("font load"):
+                    font = self._load(face, size, bold)
+            else:
+                font = self._load(face, size, bold)
+            self.fonts[key] = font
+        return font
+
+    def resolve(self, face, bold=False):
+        # Same choice as SysFont: the first face with an installed file, else
+        # pygame's default font; bold is synthesised when no bold file exists.
+        key = f"{face}|{'bold' if bold else 'regular'}"
+        entry = self.paths.get(key)
+        if entry is not None and (entry["path"] is None or os.path.exists(entry["path"])):
+            return entry
+        path = None
+        for name in face.split(","):
+            path = pygame.font.match_font(name.strip(), bold=bold)
+            if path:
+                break
+        synthetic = bold and (path is None or "bold" not in os.path.basename(path).lower())
+        entry = self.paths[key] = {"path": path, "bold": synthetic}
+        if self.persistence and self.cache_path:
+            self.persistence.replace(self.cache_path, json.dumps(self.paths, indent=1).encode())
+        return entry
+
+    def _load(self, face, size, bold):
+        if face is None:
+            return pygame.font.Font(None, size)
+        try:
+            entry = self.resolve(face, bold)
+            font = pygame.font.Font(entry["path"], size)
+            font.set_bold(entry["bold"])
+            return font
+        except Exception:
+            return pygame.font.Font(None, size)
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, colour); a string is only
+    # rasterised again once it has changed or been evicted.
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def render(self, font, text, color):
+        key = (font, text, tuple(color))
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = self.surfaces[key] = font.render(text, True, color)
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.surfaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class DirtyRects:
+    # Tracks what was drawn this frame and last frame so only those areas need
+    # to be cleared and pushed to the display. invalidate() forces a full flip.
+    def __init__(self):
+        self.previous = []
+        self.current = []
+        self.full = True
+        self.pixels = 0
+        self.frames = 0
+        self.total_pixels = 0
+
+    def invalidate(self):
+        self.full = True
+
+    def add(self, rect):
+        if rect:
+            self.current.append(pygame.Rect(rect))
+
+    def add_all(self, rects):
+        if rects:
+            self.current.append(pygame.Rect(rects[0]).unionall(rects[1:]))
+
+    def restore(self, surface, color):
+        for rect in self.previous:
+            surface.fill(color, rect)
+
+    def present(self, surface, viewport=None):
+        bounds = surface.get_rect()
+        rects = [] if self.full else [r.clip(bounds) for r in self.previous + self.current]
+        rects = [r for r in rects if r.width and r.height]
+        pixels = sum(r.width * r.height for r in rects)
+        # Overlapping rects that add up to more than the screen cost more
+        # than one full flip.
+        if self.full or pixels >= bounds.width * bounds.height:
+            if viewport:
+                viewport.blit()
+            pygame.display.flip()
+            self.pixels = bounds.width * bounds.height
+        else:
+            pygame.display.update(viewport.blit(rects) if viewport else rects)
+            self.pixels = pixels
+        self.frames += 1
+        self.total_pixels += self.pixels
+        self.previous, self.current = self.current, []
+        self.full = False
+
+
+def ball_sprites(sprites, rects, color):
+    # One cache lookup per ball size rather than per ball.
+    return {w: sprites.get("ellipse", int(w) // 2, color) for w in {r[2] for r in rects}}
+
+
+class Trails:
+    # Motion trails for every ball, accumulated on one persistent alpha
+    # surface: each tick everything on it fades and the balls are stamped on
+    # top. Drawing is then a single blit however many balls there are or how
+    # long the trails get. Only the area stamped in the last `length` ticks is
+    # faded, blitted and marked dirty, so a lone ball's trail stays cheap.
+    def __init__(self, size, sprites, length=20, decay=0.85):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.sprites = sprites
+        self.enabled = True
+        self.configure(length, decay)
+
+    def configure(self, length, decay):
+        self.length = length
+        # Fading is a lookup on the alpha channel: scale by decay, then take
+        # a fixed step off so every pixel is empty within `length` ticks.
+        # (Blended fills do the same but are several times slower.)
+        self.fade = np.maximum(np.arange(256) * decay - 255 / length, 0).astype(np.uint8)
+        self.stamps = deque(maxlen=length)
+        self.clear()
+
+    def clear(self):
+        self.surface.fill((0, 0, 0, 0))
+        self.stamps.clear()
+        self.area = None
+
+    def stamp(self, rects, color):
+        if not self.enabled:
+            return
+        if self.area:
+            alpha = pygame.surfarray.pixels_alpha(self.surface)[self.area.left:self.area.right,
+                                                                self.area.top:self.area.bottom]
+            alpha[...] = self.fade[alpha]  # a gather into a copy beats np.take into the strided view
+            del alpha
+        sprites = ball_sprites(self.sprites, rects, color)
+        drawn = self.surface.blits([(sprites[w], (x, y)) for x, y, w, h in rects])
+        self.stamps.append(drawn[0].unionall(drawn[1:]) if drawn else None)
+        live = [r for r in self.stamps if r]
+        self.area = live[0].unionall(live[1:]) if live else None
+
+    def draw(self, surface):
+        if self.enabled and self.area:
+            return surface.blit(self.surface, self.area.topleft, self.area)
+
+
+class Viewport:
+    # Presents a fixed logical-resolution canvas in a window of any size,
+    # scaled to fit and letterboxed. The transform is only recomputed when the
+    # window changes, and at the logical size the canvas is the window itself.
+    def __init__(self, size):
+        self.size = tuple(size)
+        self.window = None
+        self.window_size = None
+        self.identity = True
+        self.scale = 1.0
+        self.rect = pygame.Rect((0, 0), self.size)
+        self.canvas = None
+        self.offscreen = None
+        self.target = None
+
+    def resize(self, window):
+        size = window.get_size()
+        if window is self.window and size == self.window_size:
+            return False
+        self.window, self.window_size = window, size
+        w, h = self.size
+        self.scale = min(size[0] / w, size[1] / h)
+        dw, dh = max(1, round(w * self.scale)), max(1, round(h * self.scale))
+        self.rect = pygame.Rect((size[0] - dw) // 2, (size[1] - dh) // 2, dw, dh)
+        self.identity = size == self.size
+        if self.identity:
+            self.canvas, self.target = window, None
+        else:
+            if self.offscreen is None:
+                self.offscreen = pygame.Surface(self.size).convert()
+            self.canvas = self.offscreen
+            window.fill((0, 0, 0))
+            self.target = window.subsurface(self.rect)
+        return True
+
+    def to_logical(self, pos):
+        return (int((pos[0] - self.rect.x) / self.scale), int((pos[1] - self.rect.y) / self.scale))
+
+    def to_window(self, pos):
+        return (int(pos[0] * self.scale) + self.rect.x, int(pos[1] * self.scale) + self.rect.y)
+
+    def _window_rect(self, rect):
+        # Rounded outwards so no window pixel under a dirty rect is left stale.
+        s = self.scale
+        x0, y0 = math.floor(rect.x * s), math.floor(rect.y * s)
+        x1 = min(self.rect.width, math.ceil(rect.right * s))
+        y1 = min(self.rect.height, math.ceil(rect.bottom * s))
+        return pygame.Rect(x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+    def blit(self, rects=None):
+        # Scales the whole canvas, or only the given logical rects of it, onto
+        # the window and returns the window rects to update.
+        if self.identity:
+            return rects
+        if rects is None:
+            pygame.transform.scale(self.canvas, self.rect.size, self.target)
+            return [self.rect]
+        updated = []
+        for rect in rects:
+            dest = self._window_rect(rect)
+            if dest.width and dest.height:
+                pygame.transform.scale(self.canvas.subsurface(rect), dest.size, self.target.subsurface(dest))
+                updated.append(dest.move(self.rect.topleft))
+        return updated
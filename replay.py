@@ -0,0 +1,174 @@
+import argparse
+import bisect
+import json
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from sim import Simulation, TICK_RATE
+
+MAGIC = b"PONGRPL\x03"  # 3: power-up colours left out of the match state
+CHECKSUM_INTERVAL = 60
+KEYFRAME_INTERVAL = 600
+
+
+class ReplayError(Exception):
+    pass
+
+
+def encode_input(left, right):
+    return (int(left) + 1) | ((int(right) + 1) << 2)
+
+
+def decode_input(code):
+    return (code & 3) - 1, ((code >> 2) & 3) - 1
+
+
+class ReplayRecorder:
+    # Inputs are packed two ticks per byte (2 bits per paddle). A state
+    # checksum is stored every CHECKSUM_INTERVAL ticks and a full keyframe
+    # every KEYFRAME_INTERVAL ticks so playback can seek.
+    def __init__(self, sim, checksum_interval=CHECKSUM_INTERVAL, keyframe_interval=KEYFRAME_INTERVAL):
+        self.header = {
+            "seed": int(sim.seed[0]),
+            "ai": [bool(a) for a in sim.ai[0]],
+            "params": sim.params(),
+            "checksum_interval": checksum_interval,
+            "keyframe_interval": keyframe_interval,
+        }
+        self.checksum_interval = checksum_interval
+        self.keyframe_interval = keyframe_interval
+        self.inputs = bytearray()
+        self.ticks = 0
+        self.checksums = []
+        self.keyframes = [(int(sim.tick[0]), zlib.compress(sim.state_bytes()))]
+
+    def record(self, sim, actions):
+        code = encode_input(*actions)
+        if self.ticks % 2 == 0:
+            self.inputs.append(code)
+        else:
+            self.inputs[-1] |= code << 4
+        self.ticks += 1
+        tick = int(sim.tick[0])
+        if tick % self.checksum_interval == 0:
+            self.checksums.append((tick, sim.checksum()))
+        if tick % self.keyframe_interval == 0:
+            self.keyframes.append((tick, zlib.compress(sim.state_bytes())))
+
+    def save(self, path):
+        header = json.dumps(dict(self.header, ticks=self.ticks)).encode()
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(struct.pack("<I", len(self.inputs)))
+            f.write(self.inputs)
+            f.write(struct.pack("<I", len(self.checksums)))
+            f.write(np.array(self.checksums, dtype="<u4").tobytes())
+            f.write(struct.pack("<I", len(self.keyframes)))
+            for tick, data in self.keyframes:
+                f.write(struct.pack("<II", tick, len(data)))
+                f.write(data)
+
+
+class ReplayPlayer:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ReplayError(f"{path} is not a replay file")
+        offset = len(MAGIC)
+
+        def take(n):
+            nonlocal offset
+            chunk = data[offset:offset + n]
+            if len(chunk) != n:
+                raise ReplayError(f"{path} is truncated")
+            offset += n
+            return chunk
+
+        def u32():
+            return struct.unpack("<I", take(4))[0]
+
+        self.header = json.loads(take(u32()))
+        self.ticks = self.header["ticks"]
+        self.inputs = take(u32())
+        count = u32()
+        pairs = np.frombuffer(take(count * 8), dtype="<u4").reshape(-1, 2)
+        self.checksums = {int(t): int(c) for t, c in pairs}
+        self.keyframes = []
+        for _ in range(u32()):
+            tick, length = struct.unpack("<II", take(8))
+            self.keyframes.append((tick, take(length)))
+        self.sim = Simulation(1, seed=self.header["seed"], ai=self.header["ai"], **self.header["params"])
+        self.start = self.keyframes[0][0]
+
+    @property
+    def tick(self):
+        return int(self.sim.tick[0])
+
+    @property
+    def finished(self):
+        return self.tick - self.start >= self.ticks
+
+    def actions_at(self, tick):
+        i = tick - self.start
+        code = self.inputs[i // 2]
+        return decode_input(code >> 4 if i % 2 else code & 15)
+
+    def next_actions(self):
+        return self.actions_at(self.tick)
+
+    def step(self, verify=True):
+        self.sim.step([self.next_actions()])
+        expected = self.checksums.get(self.tick)
+        if verify and expected is not None and expected != self.sim.checksum():
+            raise ReplayError(f"desync at tick {self.tick}")
+
+    def seek(self, tick):
+        tick = max(self.start, min(tick, self.start + self.ticks))
+        i = bisect.bisect_right([t for t, _ in self.keyframes], tick) - 1
+        self.sim.load_state_bytes(zlib.decompress(self.keyframes[i][1]))
+        while self.tick < tick:
+            self.step()
+
+    def run(self, realtime=False):
+        next_time = time.perf_counter()
+        while not self.finished:
+            self.step()
+            if realtime:
+                next_time += 1.0 / TICK_RATE
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back or verify an Ultimate Pong replay")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, default=0, help="tick to start from")
+    parser.add_argument("--realtime", action="store_true", help="render the replay at normal speed")
+    args = parser.parse_args(argv)
+
+    player = ReplayPlayer(args.path)
+    player.seek(args.seek)
+    if args.realtime:
+        import asyncio
+        import pygame
+        import pong
+        pygame.init()
+        game = pong.PongGame()
+        game.start_replay(player)
+        asyncio.run(game.run())
+        return 0
+    start = time.perf_counter()
+    first = player.tick
+    player.run()
+    elapsed = time.perf_counter() - start
+    left, right = player.sim.score[0]
+    print(f"{player.tick - first} ticks verified in {elapsed:.2f}s, final score {left} - {right}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from sim import Simulation, TICK_RATE
+
+TICK = 1.0 / TICK_RATE
+MAX_LAG = 0.25
+FRAME_FIELDS = ["tick", "score", "paddle_y", "prev_paddle_y", "paddle_h", "ball_x", "ball_y",
+                "prev_ball_x", "prev_ball_y", "ball_size", "ball_alive", "pu_x", "pu_y", "pu_kind",
+                "pu_alive", "fx_kind", "fx_side", "fx_until", "fx_alive"]
+
+
+class Frame:
+    # Immutable copy of one match after a tick, with that tick's events. It
+    # answers the same drawing queries as a Simulation (for match 0), so the
+    # renderer never touches state the simulation thread is changing.
+    paddle_x = Simulation.paddle_x
+    paddle_rects = Simulation.paddle_rects
+    ball_rects = Simulation.ball_rects
+    powerup_items = Simulation.powerup_items
+    active_effects = Simulation.active_effects
+
+    def __init__(self, sim, n, time):
+        for name in FRAME_FIELDS:
+            setattr(self, name, getattr(sim, name)[n:n + 1].copy())
+        self.width, self.height = sim.width, sim.height
+        self.events = [e for e in sim.events if e[1] == n]
+        self.time = time
+
+
+class FrameQueue:
+    # Bounded handoff from the simulation to the renderer. When the renderer
+    # falls behind, the oldest frames are dropped but their events are folded
+    # into the next one, so no hit, sound or score is lost.
+    def __init__(self, capacity=4):
+        self.frames = deque()
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, frame):
+        with self.lock:
+            if len(self.frames) == self.capacity:
+                oldest = self.frames.popleft()
+                self.frames[0].events[:0] = oldest.events
+                self.dropped += 1
+            self.frames.append(frame)
+
+    def drain(self):
+        with self.lock:
+            frames = list(self.frames)
+            self.frames.clear()
+        return frames
+
+
+class InputQueue:
+    # Input changes stamped with the time they were read; each tick applies
+    # every change made before the moment it simulates.
+    def __init__(self, actions):
+        self.pending = deque()
+        self.current = actions
+
+    def push(self, stamp, actions):
+        self.pending.append((stamp, actions))
+
+    def actions_at(self, stamp):
+        while self.pending and self.pending[0][0] <= stamp:
+            self.current = self.pending.popleft()[1]
+        return self.current
+
+
+class SimRunner:
+    # Steps a Simulation at a fixed rate on its own thread (or as an asyncio
+    # task where threads are unavailable), publishing a Frame per tick.
+    # actions(tick_time) supplies the inputs and on_tick(actions) runs after
+    # each step on the simulation side, e.g. to record a replay. The runner
+    # stops once every match is over or until() returns true.
+    def __init__(self, sim, actions, on_tick=None, until=None, capacity=4):
+        self.sim = sim
+        self.actions = actions
+        self.on_tick = on_tick
+        self.until = until
+        self.frames = FrameQueue(capacity)
+        self.paused = False
+        self.stopped = threading.Event()
+        self.thread = None
+        self.task = None
+        self.next_tick = None
+        self.ticks = 0
+
+    def start(self):
+        self.next_tick = time.perf_counter() + TICK
+        try:
+            self.thread = threading.Thread(target=self._run_thread, daemon=True, name="simulation")
+            self.thread.start()
+        except RuntimeError:
+            self.thread = None
+            self.task = asyncio.get_running_loop().create_task(self._run_task())
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        if self.task is not None:
+            self.task.cancel()
+
+    @property
+    def finished(self):
+        return self.stopped.is_set()
+
+    def _advance(self):
+        # Runs every tick that is due; returns how long until the next one.
+        now = time.perf_counter()
+        if self.paused:
+            self.next_tick = now + TICK
+            return TICK
+        if now - self.next_tick > MAX_LAG:
+            self.next_tick = now
+        while self.next_tick <= now and not self.stopped.is_set():
+            if self.sim.done.all() or (self.until and self.until()):
+                self.stopped.set()
+                break
+            actions = self.actions(self.next_tick)
+            self.sim.step(actions)
+            if self.on_tick:
+                self.on_tick(actions)
+            self.frames.put(Frame(self.sim, 0, self.next_tick))
+            self.next_tick += TICK
+            self.ticks += 1
+        return self.next_tick - time.perf_counter()
+
+    def _run_thread(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(max(0.0, self._advance()))
+
+    async def _run_task(self):
+        while not self.stopped.is_set():
+            await asyncio.sleep(max(0.0, self._advance()))
@@ -0,0 +1,655 @@
+import sys
+import time
+import zlib
+import numpy as np
+from broadphase import SpatialHash
+from powerups import POWERUPS, POWERUP_SPECS, MAX_EFFECTS, ExpiryQueue, spawn_gap
+
+WIDTH, HEIGHT = 1000, 600
+WIN_SCORE = 10
+BALL_SPEED = 7
+AI_SPEED = 6
+AI_MISS_CHANCE = 0.08
+AI_PREDICT = True
+
+# AI difficulty presets, built on the AI_SPEED / AI_MISS_CHANCE / AI_PREDICT knobs.
+DIFFICULTIES = {
+    "Easy": {"ai_speed": 4, "ai_miss_chance": 0.25, "ai_predict": False},
+    "Normal": {"ai_speed": AI_SPEED, "ai_miss_chance": AI_MISS_CHANCE, "ai_predict": AI_PREDICT},
+    "Hard": {"ai_speed": 9, "ai_miss_chance": 0.02, "ai_predict": True},
+}
+
+POWERUP_TYPES = list(POWERUPS)
+POWERUP_CHANCE = 0.005
+POWERUP_SIZE = 34
+MAX_POWERUPS = 2
+
+PADDLE_WIDTH, PADDLE_HEIGHT = 15, 90
+PADDLE_SPEED = 7
+PADDLE_MARGIN = 30
+BALL_SIZE = 20
+MAX_BALLS = 3
+HIT_SPEEDUP = 1.07
+MAX_BALL_SPEED = 45
+TICK_RATE = 60
+MAX_SUBSTEP = BALL_SIZE
+AI_DEAD_ZONE = 10
+GRID_CELL = 64
+SERVE_SCATTER = 60   # with ball collisions, balls served together start up to this far apart
+# Per-side stats that timed power-up effects change: the value with no
+# effect active, and the range effects may push it to.
+STATS = {"paddle_h": (float(PADDLE_HEIGHT), 30.0, 240.0), "paddle_speed": (1.0, 0.5, 3.0)}
+
+# "Chaos" mode: hundreds of balls that respawn instead of leaving play, no
+# MultiBall cap, ball-vs-ball collisions and a spatial-hash broadphase.
+CHAOS = {
+    "ball_capacity": 1024, "start_balls": 128, "max_balls": None, "multiball_count": 32,
+    "respawn": True, "ball_collisions": True, "broadphase": True,
+    "max_powerups": 6, "powerup_chance": 0.03, "win_score": 1000,
+}
+
+# Random streams. Every draw is a pure function of (seed, tick, stream), so a
+# match replays identically whatever batch it runs in.
+_RS_AI = 1
+_RS_JITTER_LEFT = 2
+_RS_JITTER_RIGHT = 3
+_RS_ANGLE = 4
+_RS_DIRECTION = 5
+_RS_SPAWN = 6
+_RS_SPAWN_KIND = 7
+_RS_SPAWN_X = 8
+_RS_SPAWN_Y = 9
+_RS_SERVE_X = 11
+_RS_SERVE_Y = 12
+
+# Arrays that make up a match's state, in serialisation order. The prev_*
+# arrays only feed render interpolation and are left out of checksums.
+STATE_FIELDS = ["tick", "score", "done", "paddle_y", "paddle_h", "ball_x", "ball_y", "ball_vx", "ball_vy",
+                "ball_size", "ball_alive", "pu_x", "pu_y", "pu_kind", "pu_alive",
+                "intercept_tick", "intercept_y", "intercept_valid", "paddle_speed", "pu_next_spawn",
+                "fx_kind", "fx_side", "fx_until", "fx_alive"]
+RENDER_FIELDS = ["prev_ball_x", "prev_ball_y", "prev_paddle_y"]
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x):
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def per_side(value, side):
+    # AI settings may be a single value or a (left, right) pair.
+    return value[side] if isinstance(value, (tuple, list)) else value
+
+
+def uniform(seed, tick, stream):
+    x = _mix(seed * _GOLDEN + _mix(tick * _GOLDEN + stream))
+    return (x >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+class Simulation:
+    def __init__(self, n=1, width=WIDTH, height=HEIGHT, seed=0, ai=(False, True),
+                 ball_capacity=MAX_BALLS + 1, win_score=WIN_SCORE, ball_speed=BALL_SPEED,
+                 ai_speed=AI_SPEED, ai_miss_chance=AI_MISS_CHANCE, ai_predict=AI_PREDICT,
+                 powerup_chance=POWERUP_CHANCE, max_powerups=MAX_POWERUPS, max_balls=MAX_BALLS,
+                 multiball_count=2, start_balls=1, respawn=False, ball_collisions=False, broadphase=False,
+                 record_events=False):
+        self.n = n
+        self.ball_capacity = ball_capacity
+        self.width, self.height = width, height
+        self.win_score = win_score
+        self.ball_speed = ball_speed
+        self.ai_speed = ai_speed
+        self.ai_miss_chance = ai_miss_chance
+        self.ai_predict = ai_predict
+        self.powerup_chance = powerup_chance
+        self.max_powerups = max_powerups
+        self.max_balls = max_balls
+        self.multiball_count = multiball_count
+        self.start_balls = min(start_balls, ball_capacity)
+        self.respawn = respawn
+        self.ball_collisions = ball_collisions
+        self.broadphase = broadphase
+        self.grid = None
+        self.record_events = record_events
+        self.events = []
+
+        self.seed = np.broadcast_to(np.asarray(seed, dtype=np.uint64), (n,)).copy()
+        self.ai = np.broadcast_to(np.asarray(ai, dtype=bool), (n, 2)).copy()
+        self.tick = np.zeros(n, dtype=np.uint64)
+        self.score = np.zeros((n, 2), dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+
+        self.paddle_y = np.zeros((n, 2))
+        self.paddle_h = np.full((n, 2), float(PADDLE_HEIGHT))
+        self.paddle_speed = np.ones((n, 2))
+
+        b = ball_capacity
+        self.ball_x = np.zeros((n, b))
+        self.ball_y = np.zeros((n, b))
+        self.ball_vx = np.zeros((n, b))
+        self.ball_vy = np.zeros((n, b))
+        self.ball_size = np.full((n, b), float(BALL_SIZE))
+        self.ball_alive = np.zeros((n, b), dtype=bool)
+        self.prev_ball_x = np.zeros((n, b))
+        self.prev_ball_y = np.zeros((n, b))
+        self.prev_paddle_y = np.zeros((n, 2))
+        self.intercept_tick = np.zeros((n, b))
+        self.intercept_y = np.zeros((n, b))
+        self.intercept_valid = np.zeros((n, b), dtype=bool)
+
+        self.pu_x = np.zeros((n, max_powerups))
+        self.pu_y = np.zeros((n, max_powerups))
+        self.pu_kind = np.zeros((n, max_powerups), dtype=np.int64)
+        self.pu_alive = np.zeros((n, max_powerups), dtype=bool)
+        self.pu_next_spawn = np.zeros(n, dtype=np.uint64)
+
+        # Timed power-up effects, one row of slots per match; the queue only
+        # indexes their expiries and is rebuilt from these arrays on restore.
+        self.fx_kind = np.zeros((n, MAX_EFFECTS), dtype=np.int64)
+        self.fx_side = np.zeros((n, MAX_EFFECTS), dtype=np.int64)
+        self.fx_until = np.zeros((n, MAX_EFFECTS), dtype=np.uint64)
+        self.fx_alive = np.zeros((n, MAX_EFFECTS), dtype=bool)
+        self.expiries = ExpiryQueue()
+
+        self.reset()
+
+    @property
+    def paddle_x(self):
+        return (PADDLE_MARGIN, self.width - PADDLE_MARGIN - PADDLE_WIDTH)
+
+    def _rand(self, stream, rows=None, slots=0):
+        seed, tick = self.seed, self.tick
+        if rows is not None:
+            seed, tick = seed[rows], tick[rows]
+        return uniform(seed, tick, np.uint64(stream << 16) + np.asarray(slots, dtype=np.uint64))
+
+    def reset(self, mask=None):
+        rows = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        self.tick[rows] = 0
+        self.score[rows] = 0
+        self.done[rows] = False
+        self.pu_alive[rows] = False
+        self.fx_alive[rows] = False
+        self.paddle_h[rows] = PADDLE_HEIGHT
+        self.paddle_speed[rows] = 1.0
+        self.ball_alive[rows] = False
+        self.ball_vx[rows] = self.ball_vy[rows] = 0
+        self._reset_paddles(rows)
+        k = self.start_balls
+        self._serve(np.repeat(rows, k), np.tile(np.arange(k), len(rows)))
+        self._schedule_spawn(rows)
+        self._rebuild_expiries()
+
+    def _reset_paddles(self, rows):
+        # Paddle heights are left alone: they belong to the active effects.
+        self.paddle_y[rows] = self.prev_paddle_y[rows] = self.height // 2 - self.paddle_h[rows] // 2
+
+    def _serve(self, rows, slots, center=None):
+        if len(rows) == 0:
+            return
+        angle = self._rand(_RS_ANGLE, rows, slots) - 0.5
+        d = self._rand(_RS_DIRECTION, rows, slots)
+        direction = np.where(d < 0.5, -1.0, 1.0)
+        if center is None:
+            cx, cy = self.width // 2, self.height // 2
+        else:
+            cx, cy = center
+        x, y = cx - BALL_SIZE // 2, cy - BALL_SIZE // 2
+        if self.ball_collisions:
+            # Colliding balls served onto one spot would all overlap at once;
+            # a court-centre serve spreads them over the middle of the court.
+            spread_x = self.width / 8 if center is None else SERVE_SCATTER
+            spread_y = self.height / 2 if center is None else SERVE_SCATTER
+            x = x + np.floor((self._rand(_RS_SERVE_X, rows, slots) * 2 - 1) * spread_x)
+            y = y + np.floor((self._rand(_RS_SERVE_Y, rows, slots) * 2 - 1) * spread_y)
+            x = np.clip(x, PADDLE_MARGIN + PADDLE_WIDTH, self.width - PADDLE_MARGIN - PADDLE_WIDTH - BALL_SIZE)
+            y = np.clip(y, 0, self.height - BALL_SIZE)
+        self.ball_size[rows, slots] = BALL_SIZE
+        self.ball_x[rows, slots] = self.prev_ball_x[rows, slots] = x
+        self.ball_y[rows, slots] = self.prev_ball_y[rows, slots] = y
+        self.ball_vx[rows, slots] = direction * self.ball_speed * np.cos(angle)
+        self.ball_vy[rows, slots] = self.ball_speed * np.sin(angle)
+        self.ball_alive[rows, slots] = True
+        self.intercept_valid[rows, slots] = False
+
+    def first_ball(self):
+        return np.argmax(self.ball_alive, axis=1)
+
+    def _update_intercepts(self):
+        # Where and when each ball will reach the paddle face it is heading
+        # for. Wall bounces are folded in closed form, so the result only
+        # changes on paddle hits, power-ups and serves, which invalidate it.
+        r, b = np.nonzero(self.ball_alive & ~self.intercept_valid)
+        if not len(r):
+            return
+        s = self.ball_size[r, b]
+        x, y = self.ball_x[r, b], self.ball_y[r, b]
+        vx, vy = self.ball_vx[r, b], self.ball_vy[r, b]
+        lx, rx = self.paddle_x
+        gap = np.where(vx > 0, rx - (x + s), lx + PADDLE_WIDTH - x)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(vx != 0, gap / vx, np.inf)
+        t = np.where(t >= 0, t, 0.0)
+        span = np.maximum(self.height - s, 1.0)
+        folded = np.mod(y + vy * np.where(np.isfinite(t), t, 0.0), 2 * span)
+        folded = np.where(folded > span, 2 * span - folded, folded)
+        self.intercept_tick[r, b] = self.tick[r] + t
+        self.intercept_y[r, b] = folded + s / 2
+        self.intercept_valid[r, b] = True
+
+    def ai_target(self, side):
+        # Track the ball that will reach this side first; with none incoming,
+        # follow the first ball in play as the original AI did.
+        rows = np.arange(self.n)
+        self._update_intercepts()
+        incoming = self.ball_alive & ((self.ball_vx > 0) if side == 1 else (self.ball_vx < 0))
+        eta = np.where(incoming, self.intercept_tick - self.tick[:, None], np.inf)
+        b = np.argmin(eta, axis=1)
+        tracked = np.isfinite(eta[rows, b])
+        b = np.where(tracked, b, self.first_ball())
+        current = self.ball_y[rows, b] + self.ball_size[rows, b] / 2
+        if not per_side(self.ai_predict, side):
+            return current
+        return np.where(tracked, self.intercept_y[rows, b], current)
+
+    def _ai(self, side, live):
+        rows = live & self.ai[:, side]
+        if not rows.any():
+            return
+        target = self.ai_target(side)
+        y, h = self.paddle_y[:, side], self.paddle_h[:, side]
+        center = y + h // 2
+        diff = np.abs(center - target)
+        act = rows & (diff > AI_DEAD_ZONE) & (self._rand(_RS_AI + side * 16) > per_side(self.ai_miss_chance, side))
+        move = np.minimum(per_side(self.ai_speed, side) * self.paddle_speed[:, side], diff)
+        down = act & (center < target) & (y + h < self.height)
+        up = act & (center > target) & (y > 0)
+        dy = np.where(down, move, np.where(up, -move, 0.0))
+        self.paddle_y[:, side] = np.clip(np.trunc(y + dy), 0, self.height - h)
+
+    def _emit(self, kind, rows, slots, data=None):
+        for n, b in zip(rows, slots):
+            size = self.ball_size[n, b]
+            pos = (self.ball_x[n, b] + size // 2, self.ball_y[n, b] + size // 2)
+            self.events.append((kind, int(n), pos, data))
+
+    def step(self, actions=None):
+        self.events = []
+        live = ~self.done
+        self.prev_ball_x[:] = self.ball_x
+        self.prev_ball_y[:] = self.ball_y
+        self.prev_paddle_y[:] = self.paddle_y
+        if actions is not None:
+            actions = np.asarray(actions)
+            manual = live[:, None] & ~self.ai
+            dy = np.where(manual, actions * PADDLE_SPEED * self.paddle_speed, 0)
+            self.paddle_y[:] = np.clip(self.paddle_y + dy, 0, self.height - self.paddle_h)
+        self._ai(0, live)
+        self._ai(1, live)
+        self._advance(live)
+        self._spawn_powerups(live)
+        self._score(live)
+        self.tick[live] += np.uint64(1)
+        due = self.expiries.advance()
+        if due:
+            self._expire_effects(due)
+
+    def _advance(self, live):
+        # Each ball picks its own substep count from its speed at the start of
+        # the tick, so a match steps identically whatever batch it is in.
+        active = self.ball_alive & live[:, None]
+        speed = np.maximum(np.abs(self.ball_vx), np.abs(self.ball_vy))
+        steps = np.maximum(1, np.ceil(speed / MAX_SUBSTEP))
+        dt = 1.0 / steps
+        if self.broadphase and active.any():
+            cell = max(GRID_CELL, self.ball_size[active].max() + MAX_SUBSTEP, POWERUP_SIZE)
+            self.grid = SpatialHash(cell, self.width, self.height)
+        for i in range(int(steps[active].max()) if active.any() else 0):
+            self._substep(active & (steps > i), dt)
+        if self.ball_collisions and active.any():
+            self._collide_balls(active)
+
+    def _paddle_hits(self, side, r, b, dx, dy):
+        # Swept test against the paddle face: a hit is registered when the
+        # leading edge crosses the face during this substep, whatever the speed.
+        x, y, s = self.ball_x[r, b], self.ball_y[r, b], self.ball_size[r, b]
+        py, ph = self.paddle_y[r, side], self.paddle_h[r, side]
+        px = self.paddle_x[side]
+        safe_dx = np.where(dx == 0, 1.0, dx)
+        if side == 0:
+            face = px + PADDLE_WIDTH
+            yt = y + dy * np.clip((face - x) / safe_dx, 0, 1)
+            crossed = (x >= face) & (x + dx < face)
+            inside = (x < face) & (px < x + s)
+        else:
+            yt = y + dy * np.clip((px - x - s) / safe_dx, 0, 1)
+            crossed = (x + s <= px) & (x + s + dx > px)
+            inside = (x < px + PADDLE_WIDTH) & (px < x + s)
+        return ((crossed & (yt < py + ph) & (yt + s > py))
+                | (inside & (y < py + ph) & (py < y + s)))
+
+    def _substep(self, active, dt):
+        x, y, s = self.ball_x, self.ball_y, self.ball_size
+        vx, vy = self.ball_vx, self.ball_vy
+        dx = np.where(active, vx * dt, 0.0)
+        dy = np.where(active, vy * dt, 0.0)
+        if self.broadphase:
+            cx, cy = self.grid.cells(x + s / 2, y + s / 2)
+        hits = []
+        for side, sign in ((0, 1), (1, -1)):
+            candidates = active & (dx * sign < 0)
+            if self.broadphase:
+                px, py = self.paddle_x[side], self.paddle_y[:, side:side + 1]
+                candidates &= self.grid.near_rect(cx, cy, px, py, px + PADDLE_WIDTH,
+                                                  py + self.paddle_h[:, side:side + 1])
+            r, b = np.nonzero(candidates)
+            hit = self._paddle_hits(side, r, b, dx[r, b], dy[r, b])
+            r, b = r[hit], b[hit]
+            hits.append((r, b))
+            if not len(r):
+                continue
+            x[r, b] = self.paddle_x[0] + PADDLE_WIDTH if side == 0 else self.paddle_x[1] - s[r, b]
+            dx[r, b] = 0
+            self.intercept_valid[r, b] = False
+            vx[r, b] = sign * np.minimum(np.abs(vx[r, b]) * HIT_SPEEDUP, MAX_BALL_SPEED)
+            vy[r, b] += self._rand(_RS_JITTER_LEFT if side == 0 else _RS_JITTER_RIGHT, r, b) * 2 - 1
+
+        x += dx
+        y += dy
+        top = active & (y < 0)
+        bottom = active & (y + s > self.height)
+        y[top] = -y[top]
+        vy[top] = np.abs(vy[top])
+        y[bottom] = 2 * (self.height - s[bottom]) - y[bottom]
+        vy[bottom] = -np.abs(vy[bottom])
+        if self.record_events:
+            for side, (r, b) in enumerate(hits):
+                self._emit("hit", r, b, side)
+            self._emit("wall", *np.nonzero(top | bottom))
+        if self.pu_alive.any():
+            self._collect_powerups(active)
+
+    def _collide_balls(self, active):
+        # Equal-mass elastic collisions between overlapping balls, found through
+        # the spatial hash and resolved in a fixed order for determinism.
+        r, b = np.nonzero(active)
+        s = self.ball_size[r, b]
+        cx, cy = self.ball_x[r, b] + s / 2, self.ball_y[r, b] + s / 2
+        if self.broadphase:
+            keys = self.grid.keys(r, cx, cy)
+            i, j = self.grid.pairs(keys, keys, same=True)
+        else:
+            i, j = np.triu_indices(len(r), 1)
+            same = r[i] == r[j]
+            i, j = i[same], j[same]
+        ox, oy = cx[j] - cx[i], cy[j] - cy[i]
+        dist = np.hypot(ox, oy)
+        reach = (s[i] + s[j]) / 2
+        touching = (dist < reach) & (dist > 0)
+        if not touching.any():
+            return
+        i, j, ox, oy, dist, reach = i[touching], j[touching], ox[touching], oy[touching], dist[touching], reach[touching]
+        order = np.lexsort((j, i))
+        i, j, dist, reach = i[order], j[order], dist[order], reach[order]
+        nx, ny = ox[order] / dist, oy[order] / dist
+        vx, vy = self.ball_vx[r, b], self.ball_vy[r, b]
+        closing = (vx[j] - vx[i]) * nx + (vy[j] - vy[i]) * ny
+        impulse = np.minimum(closing, 0.0)
+        push = (reach - dist) / 2
+        ddx, ddy = np.zeros(len(r)), np.zeros(len(r))
+        dvx, dvy = np.zeros(len(r)), np.zeros(len(r))
+        np.add.at(dvx, i, impulse * nx)
+        np.add.at(dvy, i, impulse * ny)
+        np.add.at(dvx, j, -impulse * nx)
+        np.add.at(dvy, j, -impulse * ny)
+        np.add.at(ddx, i, -push * nx)
+        np.add.at(ddy, i, -push * ny)
+        np.add.at(ddx, j, push * nx)
+        np.add.at(ddy, j, push * ny)
+        # A ball in a pile overlaps many others; its separation is the mean of
+        # its pushes, not their sum, so a crowd cannot fling it out of court.
+        overlaps = np.bincount(i, minlength=len(r)) + np.bincount(j, minlength=len(r))
+        touched = overlaps > 0
+        r, b, s = r[touched], b[touched], s[touched]
+        vx = vx[touched] + dvx[touched]
+        vy = self.ball_vy[r, b] + dvy[touched]
+        x = self.ball_x[r, b] + ddx[touched] / overlaps[touched]
+        y = self.ball_y[r, b] + ddy[touched] / overlaps[touched]
+        # Keep every ball heading for a goal so none can stall mid-court.
+        min_vx = self.ball_speed / 2
+        self.ball_vx[r, b] = np.where(vx < 0, np.minimum(vx, -min_vx), np.maximum(vx, min_vx))
+        # A push never carries a ball through a wall or over a goal line; one
+        # held against a wall moves away from it, as if it had bounced.
+        self.ball_vy[r, b] = np.where(y < 0, np.abs(vy), np.where(y > self.height - s, -np.abs(vy), vy))
+        self.ball_x[r, b] = np.clip(x, 1, self.width - s - 1)
+        self.ball_y[r, b] = np.clip(y, 0, self.height - s)
+        self.intercept_valid[r, b] = False
+
+    def _powerup_contacts(self, active):
+        r, b = np.nonzero(active & self.pu_alive.any(axis=1)[:, None])
+        if not self.broadphase:
+            x, y, s = self.ball_x[r, b][:, None], self.ball_y[r, b][:, None], self.ball_size[r, b][:, None]
+            px, py = self.pu_x[r], self.pu_y[r]
+            overlap = (self.pu_alive[r] & (x < px + POWERUP_SIZE) & (px < x + s)
+                       & (y < py + POWERUP_SIZE) & (py < y + s))
+            hits, p = np.nonzero(overlap)
+            return r[hits], b[hits], p
+        pr, pp = np.nonzero(self.pu_alive)
+        s = self.ball_size[r, b]
+        x, y = self.ball_x[r, b], self.ball_y[r, b]
+        px, py = self.pu_x[pr, pp], self.pu_y[pr, pp]
+        half = POWERUP_SIZE / 2
+        i, j = self.grid.pairs(self.grid.keys(r, x + s / 2, y + s / 2), self.grid.keys(pr, px + half, py + half))
+        hit = ((x[i] < px[j] + POWERUP_SIZE) & (px[j] < x[i] + s[i])
+               & (y[i] < py[j] + POWERUP_SIZE) & (py[j] < y[i] + s[i]))
+        i, j = i[hit], j[hit]
+        order = np.lexsort((pp[j], b[i], r[i]))
+        return r[i][order], b[i][order], pp[j][order]
+
+    def _collect_powerups(self, active):
+        for n, b, p in zip(*self._powerup_contacts(active)):
+            if not self.pu_alive[n, p]:
+                continue
+            self.pu_alive[n, p] = False
+            self.intercept_valid[n, b] = False
+            k = self.pu_kind[n, p]
+            spec = POWERUP_SPECS[k]
+            if spec["target"] == "ball":
+                if self.max_balls is None or self.ball_alive[n].sum() < self.max_balls:
+                    center = (self.ball_x[n, b] + self.ball_size[n, b] // 2,
+                              self.ball_y[n, b] + self.ball_size[n, b] // 2)
+                    free = np.flatnonzero(~self.ball_alive[n])[:self.multiball_count]
+                    self._serve(np.full(len(free), n), free, center)
+            else:
+                # The ball belongs to whoever hit it last, the side it is leaving.
+                side = 0 if self.ball_vx[n, b] > 0 else 1
+                self._add_effect(n, k, side if spec["target"] == "self" else 1 - side)
+            if self.record_events:
+                center = (self.pu_x[n, p] + POWERUP_SIZE // 2, self.pu_y[n, p] + POWERUP_SIZE // 2)
+                self.events.append(("powerup", int(n), center, (POWERUP_TYPES[k], spec["color"])))
+
+    def _add_effect(self, n, k, side):
+        spec = POWERUP_SPECS[k]
+        duration = np.uint64(round(spec["duration"] * TICK_RATE))
+        same = np.flatnonzero(self.fx_alive[n] & (self.fx_kind[n] == k) & (self.fx_side[n] == side))
+        if len(same) and (spec["stacking"] != "stack" or len(same) >= spec.get("max_stacks", 1)):
+            slot = same[np.argmin(self.fx_until[n, same])]
+            start = self.fx_until[n, slot] if spec["stacking"] == "extend" else self.tick[n]
+        else:
+            free = np.flatnonzero(~self.fx_alive[n])
+            if not len(free):
+                return
+            slot, start = free[0], self.tick[n]
+            self.fx_kind[n, slot], self.fx_side[n, slot], self.fx_alive[n, slot] = k, side, True
+        until = self.fx_until[n, slot] = start + duration
+        self.expiries.push(int(until) - int(self.tick[n]), int(n), int(slot), int(until))
+        self._apply_effects(n, side)
+
+    def _expire_effects(self, due):
+        for n, slot, until in due:
+            # Refreshed, cleared or rewound effects leave stale entries behind,
+            # and a finished match stops ticking with its effects in place.
+            if self.fx_alive[n, slot] and int(self.fx_until[n, slot]) == until and self.tick[n] >= until:
+                self.fx_alive[n, slot] = False
+                self._apply_effects(n, self.fx_side[n, slot])
+
+    def _rebuild_expiries(self):
+        r, s = np.nonzero(self.fx_alive)
+        until, tick = self.fx_until[r, s].tolist(), self.tick[r].tolist()
+        self.expiries.rebuild((u - t, n, slot, u) for n, slot, u, t in zip(r.tolist(), s.tolist(), until, tick))
+
+    def _apply_effects(self, n, side):
+        # Recomputes a side's stats from its active effects, keeping a resized
+        # paddle centred where it was.
+        specs = [POWERUP_SPECS[k] for k in self.fx_kind[n][self.fx_alive[n] & (self.fx_side[n] == side)]]
+        for stat, (base, low, high) in STATS.items():
+            value = base
+            for spec in specs:
+                if spec["stat"] == stat:
+                    value = value + spec["amount"] if spec["op"] == "add" else value * spec["amount"]
+            value = min(max(value, low), high, self.height)
+            if stat == "paddle_h":
+                center = self.paddle_y[n, side] + self.paddle_h[n, side] / 2
+                self.paddle_y[n, side] = min(max(center - value / 2, 0), self.height - value)
+                self.intercept_valid[n] = False
+            getattr(self, stat)[n, side] = value
+
+    def _schedule_spawn(self, rows):
+        self.pu_next_spawn[rows] = self.tick[rows] + spawn_gap(self._rand(_RS_SPAWN, rows), self.powerup_chance)
+
+    def _spawn_powerups(self, live):
+        due = live & (self.tick >= self.pu_next_spawn)
+        if not due.any():
+            return
+        rows = np.flatnonzero(due)
+        self._schedule_spawn(rows)
+        rows = rows[self.pu_alive[rows].sum(axis=1) < self.max_powerups]
+        if not len(rows):
+            return
+        slot = np.argmin(self.pu_alive[rows], axis=1)
+        w, h = self.width, self.height
+        x0, x1 = w // 4, w * 3 // 4
+        weights = np.cumsum([spec["weight"] for spec in POWERUP_SPECS])
+        kind = np.searchsorted(weights, self._rand(_RS_SPAWN_KIND, rows) * weights[-1], side="right")
+        self.pu_kind[rows, slot] = np.minimum(kind, len(weights) - 1)
+        self.pu_x[rows, slot] = x0 + np.floor(self._rand(_RS_SPAWN_X, rows) * (x1 - x0 + 1))
+        self.pu_y[rows, slot] = 100 + np.floor(self._rand(_RS_SPAWN_Y, rows) * (h - 199))
+        self.pu_alive[rows, slot] = True
+
+    def _score(self, live):
+        active = self.ball_alive & live[:, None]
+        out_left = active & (self.ball_x <= 0)
+        out_right = active & ~out_left & (self.ball_x + self.ball_size >= self.width)
+        if not (out_left.any() or out_right.any()):
+            return
+        if self.record_events:
+            self._emit("score", *np.nonzero(out_left), 1)
+            self._emit("score", *np.nonzero(out_right), 0)
+        self.score[:, 1] += out_left.sum(axis=1)
+        self.score[:, 0] += out_right.sum(axis=1)
+        out = out_left | out_right
+        if self.respawn:
+            self._serve(*np.nonzero(out))
+            self.done |= (self.score >= self.win_score).any(axis=1)
+            return
+        self.ball_alive &= ~out
+        self.ball_vx[out] = self.ball_vy[out] = 0
+        scored = np.flatnonzero((out_left | out_right).any(axis=1))
+        empty = scored[~self.ball_alive[scored].any(axis=1)]
+        self._serve(empty, np.zeros(len(empty), dtype=np.int64))
+        self._reset_paddles(scored)
+        self.done |= (self.score >= self.win_score).any(axis=1)
+
+    # alpha blends between the previous and the current tick for rendering.
+    def paddle_rects(self, n, alpha=1.0):
+        y = self.prev_paddle_y[n] + (self.paddle_y[n] - self.prev_paddle_y[n]) * alpha
+        return [(x, y[side], PADDLE_WIDTH, self.paddle_h[n, side])
+                for side, x in enumerate(self.paddle_x)]
+
+    def ball_rects(self, n, alpha=1.0):
+        alive = self.ball_alive[n]
+        x = self.prev_ball_x[n][alive] + (self.ball_x[n][alive] - self.prev_ball_x[n][alive]) * alpha
+        y = self.prev_ball_y[n][alive] + (self.ball_y[n][alive] - self.prev_ball_y[n][alive]) * alpha
+        size = self.ball_size[n][alive].tolist()
+        return list(zip(x.tolist(), y.tolist(), size, size))
+
+    def powerup_items(self, n):
+        return [(POWERUP_TYPES[k], (self.pu_x[n, p], self.pu_y[n, p], POWERUP_SIZE, POWERUP_SIZE),
+                 POWERUP_SPECS[k]["color"])
+                for p, k in zip(np.flatnonzero(self.pu_alive[n]), self.pu_kind[n][self.pu_alive[n]])]
+
+    def active_effects(self, n):
+        # (name, side, ticks left, full duration) for each timed effect, soonest to end first.
+        slots = np.flatnonzero(self.fx_alive[n])
+        slots = slots[np.argsort(self.fx_until[n, slots], kind="stable")]
+        return [(POWERUP_TYPES[self.fx_kind[n, s]], int(self.fx_side[n, s]),
+                 max(int(self.fx_until[n, s]) - int(self.tick[n]), 0),
+                 round(POWERUP_SPECS[self.fx_kind[n, s]]["duration"] * TICK_RATE))
+                for s in slots]
+
+    def params(self):
+        return {
+            "width": self.width, "height": self.height, "ball_capacity": self.ball_capacity,
+            "win_score": self.win_score, "ball_speed": self.ball_speed, "ai_speed": self.ai_speed,
+            "ai_miss_chance": self.ai_miss_chance, "ai_predict": self.ai_predict,
+            "powerup_chance": self.powerup_chance, "max_powerups": self.max_powerups,
+            "max_balls": self.max_balls, "multiball_count": self.multiball_count,
+            "start_balls": self.start_balls, "respawn": self.respawn,
+            "ball_collisions": self.ball_collisions, "broadphase": self.broadphase,
+        }
+
+    def snapshot(self):
+        state = {name: getattr(self, name).copy() for name in STATE_FIELDS + RENDER_FIELDS}
+        state["size"] = (self.width, self.height)
+        return state
+
+    def restore(self, state):
+        for name in STATE_FIELDS + RENDER_FIELDS:
+            getattr(self, name)[...] = state[name]
+        self.width, self.height = state["size"]
+        self._rebuild_expiries()
+
+    def state_bytes(self):
+        size = np.array([self.width, self.height], dtype=np.int64).tobytes()
+        return size + b"".join(getattr(self, name).tobytes() for name in STATE_FIELDS + RENDER_FIELDS)
+
+    def load_state_bytes(self, data):
+        size = np.frombuffer(data, dtype=np.int64, count=2)
+        self.width, self.height = int(size[0]), int(size[1])
+        offset = size.nbytes
+        for name in STATE_FIELDS + RENDER_FIELDS:
+            a = getattr(self, name)
+            a[...] = np.frombuffer(data, dtype=a.dtype, count=a.size, offset=offset).reshape(a.shape)
+            offset += a.nbytes
+        self._rebuild_expiries()
+
+    def checksum(self):
+        crc = 0
+        for name in STATE_FIELDS:
+            crc = zlib.crc32(getattr(self, name).tobytes(), crc)
+        return crc
+
+    def winner(self):
+        return np.where(self.score[:, 0] >= self.win_score, 0, np.where(self.score[:, 1] >= self.win_score, 1, -1))
+
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 4096
+    steps = int(argv[2]) if len(argv) > 2 else 1000
+    sim = Simulation(n, seed=np.arange(n), ai=(True, True))
+    start = time.perf_counter()
+    for _ in range(steps):
+        sim.step()
+        if sim.done.any():
+            sim.reset(sim.done)
+    elapsed = time.perf_counter() - start
+    print(f"{n} matches x {steps} steps in {elapsed:.2f}s: {n * steps / elapsed:,.0f} frames/s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
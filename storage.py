@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Read once at import: changing the umask to read it is not safe once the
+# writer thread is running.
+UMASK = _umask()
+
+
+def atomic_write(path, data):
+    # Write to a temp file next to path, then rename over it, so a crash
+    # never leaves a half-written file behind.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp makes the file private; keep the mode a plain open() would give.
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o666 & ~UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write(replacements, appends):
+    # Appends go first so an index never points past the end of its log.
+    for path, chunks in appends.items():
+        with open(path, "ab") as f:
+            f.write(b"".join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+    for path, data in replacements.items():
+        atomic_write(path, data)
+
+
+def _write_quietly(batch):
+    # Like the old synchronous save, a failed write must never crash the game.
+    try:
+        _write(*batch)
+    except OSError:
+        pass
+
+
+class Persistence:
+    # Coalesces file writes: only the latest contents of each replaced file
+    # are kept and appends are batched. Inside an event loop everything is
+    # flushed by a background task after `delay` seconds, on a worker thread,
+    # so the frame loop never waits on the disk. Without a running loop the
+    # writes wait for flush(). A single writer thread keeps batches in order.
+    def __init__(self, delay=0.5):
+        self.delay = delay
+        self.replacements = {}
+        self.appends = {}
+        self.task = None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="persistence")
+        self.inflight = None
+        self.batches = 0
+
+    def replace(self, path, data):
+        self.replacements[path] = data
+        self.schedule()
+
+    def append(self, path, data):
+        self.appends.setdefault(path, []).append(data)
+        self.schedule()
+
+    def schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._flush_later())
+
+    def _take(self):
+        batch = self.replacements, self.appends
+        self.replacements, self.appends = {}, {}
+        return batch
+
+    async def _flush_later(self):
+        while self.replacements or self.appends:
+            await asyncio.sleep(self.delay)
+            batch = self._take()
+            try:
+                self.inflight = self.executor.submit(_write_quietly, batch)
+            except RuntimeError:
+                # No worker threads (e.g. in a browser build): write inline.
+                _write_quietly(batch)
+            else:
+                await asyncio.wrap_future(self.inflight)
+            self.batches += 1
+
+    def flush(self):
+        # Synchronous; used on exit. Waits for a batch already being written.
+        if self.inflight is not None:
+            self.inflight.result()
+        if self.replacements or self.appends:
+            _write_quietly(self._take())
+            self.batches += 1
+
+
+class StatsStore:
+    # Lifetime stats backed by an append-only match log (one JSON line per
+    # match) and a small index holding the running totals and how many bytes
+    # of the log they cover. Startup reads the index and only replays log
+    # lines written after it, so it stays instant however long the history.
+    def __init__(self, log_path, index_path, persistence):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.persistence = persistence
+        self.stats = {"games": 0, "wins": 0, "losses": 0}
+        self.max_streak = 0
+        self.achievements = set()
+        self.log_size = 0
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            size = 0
+        offset = index.get("offset", 0)
+        if offset > size:
+            index, offset = {}, 0
+        self.stats.update(index.get("stats", {}))
+        self.max_streak = index.get("max_streak", 0)
+        self.achievements.update(index.get("achievements", []))
+        self.log_size = offset
+        if offset < size:
+            self._replay_log(offset)
+            self._save_index()
+        return self
+
+    def _replay_log(self, offset):
+        with open(self.log_path, "rb+") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    match = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    match = None
+                if match is None:
+                    # A line cut short by a crash; drop it so appends stay aligned.
+                    f.truncate(self.log_size)
+                    break
+                self._apply(match)
+                self.log_size += len(line)
+
+    def _apply(self, match):
+        self.stats["games"] += 1
+        # Matches from before "side" was recorded were all played on the left.
+        self.stats["wins" if match["winner"] == match.get("side", "Left") else "losses"] += 1
+        self.max_streak = max(self.max_streak, match.get("max_streak", 0))
+        self.achievements.update(match.get("achievements", []))
+
+    def _save_index(self):
+        index = {"offset": self.log_size, "stats": self.stats, "max_streak": self.max_streak,
+                 "achievements": sorted(self.achievements)}
+        self.persistence.replace(self.index_path, json.dumps(index).encode())
+
+    def record(self, match):
+        line = (json.dumps(match) + "\n").encode()
+        self._apply(match)
+        self.persistence.append(self.log_path, line)
+        self.log_size += len(line)
+        self._save_index()
+
+    def update(self, max_streak):
+        # Streaks and achievements can change mid-match; saved with the index.
+        self.max_streak = max(self.max_streak, max_streak)
+        self._save_index()
+
+    def history(self, limit=None):
+        matches = []
+        try:
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        matches.append(json.loads(line))
+                    except ValueError:
+                        break
+        except OSError:
+            pass
+        return matches[-limit:] if limit else matches
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from replay import ReplayError, ReplayPlayer, ReplayRecorder
+from sim import Simulation
+
+TICKS = 1500
+SEEK = 1234
+
+
+def record(path, tamper=False):
+    sim = Simulation(1, seed=21, ai=(False, True), win_score=1000, powerup_chance=0.05)
+    recorder = ReplayRecorder(sim)
+    rng = np.random.default_rng(4)
+    checksum_at_seek = None
+    for _ in range(TICKS):
+        action = (int(rng.integers(-1, 2)), 0)
+        sim.step([action])
+        recorder.record(sim, action)
+        if sim.tick[0] == SEEK:
+            checksum_at_seek = sim.checksum()
+    if tamper:
+        # Both paddles idle for 200 ticks of random left-paddle input.
+        recorder.inputs[300:400] = bytes([0x55] * 100)
+    recorder.save(path)
+    return sim.checksum(), checksum_at_seek
+
+
+def test_replay_verifies(tmp_path):
+    path = tmp_path / "match.rpl"
+    final, _ = record(path)
+    player = ReplayPlayer(path)
+    player.run()
+    assert player.tick == TICKS
+    assert player.sim.checksum() == final
+
+
+def test_seek_lands_on_recorded_state(tmp_path):
+    path = tmp_path / "match.rpl"
+    final, at_seek = record(path)
+    player = ReplayPlayer(path)
+    player.seek(SEEK)
+    assert player.tick == SEEK
+    assert player.sim.checksum() == at_seek
+    player.run()
+    assert player.sim.checksum() == final
+
+
+def test_changed_inputs_desync(tmp_path):
+    path = tmp_path / "match.rpl"
+    record(path, tamper=True)
+    with pytest.raises(ReplayError, match="desync"):
+        ReplayPlayer(path).run()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "match.rpl"
+    path.write_bytes(b"not a replay")
+    with pytest.raises(ReplayError):
+        ReplayPlayer(path)
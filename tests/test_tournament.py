@@ -0,0 +1,39 @@
+import json
+import pytest
+import tournament
+
+ARGS = ["--matches", "4", "--chunk", "2", "--workers", "1", "--max-ticks", "5000"]
+
+
+def sweep(tmp_path, *params):
+    output, summary = tmp_path / "sweep.jsonl", tmp_path / "summary.json"
+    grid = [arg for p in params for arg in ("--param", p)]
+    tournament.main(grid + ARGS + ["--output", str(output), "--summary", str(summary)])
+    return output, json.loads(summary.read_text())
+
+
+def test_resume_replays_only_the_torn_chunk(tmp_path, capsys):
+    output, _ = sweep(tmp_path, "win_score=1")
+    lines = output.read_bytes().splitlines(keepends=True)
+    assert len(lines) == 2
+    # An interrupted write leaves the last chunk half on disk.
+    output.write_bytes(lines[0] + lines[1][:len(lines[1]) // 2])
+    capsys.readouterr()
+    _, rows = sweep(tmp_path, "win_score=1")
+    assert "1/2 jobs already done" in capsys.readouterr().out
+    results = tournament.load_results(output)
+    assert sorted(r["chunk"] for r in results) == [0, 1]
+    assert output.read_bytes().count(b"\n") == 2
+    assert rows[0]["matches"] == 4
+
+
+def test_summary_covers_only_the_requested_grid(tmp_path):
+    sweep(tmp_path, "win_score=1,2")
+    _, rows = sweep(tmp_path, "win_score=2")
+    assert [row["params"] for row in rows] == [{"win_score": 2}]
+
+
+def test_refuses_results_from_other_settings(tmp_path):
+    output, _ = sweep(tmp_path, "win_score=1")
+    with pytest.raises(SystemExit, match="other --seed"):
+        tournament.main(["--param", "win_score=1", "--seed", "5"] + ARGS + ["--output", str(output)])
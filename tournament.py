@@ -0,0 +1,188 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import numpy as np
+from sim import Simulation, TICK_RATE, AI_SPEED, AI_MISS_CHANCE, AI_PREDICT
+
+# Parameters that can be swept. AI settings may be prefixed with "left." or
+# "right." to tune one side against the default AI on the other.
+SWEEPABLE = {
+    "ai_speed": float, "ai_miss_chance": float, "ai_predict": lambda v: v.lower() in ("1", "true", "yes"),
+    "ball_speed": float, "win_score": int, "powerup_chance": float,
+}
+PER_SIDE = {"ai_speed": AI_SPEED, "ai_miss_chance": AI_MISS_CHANCE, "ai_predict": AI_PREDICT}
+MAX_TICKS = 200_000
+
+
+def parse_grid(specs):
+    # ["ai_speed=4,6", "left.ai_predict=true,false"] -> [{"ai_speed": 4.0, ...}, ...]
+    axes = []
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        side, _, key = name.rpartition(".")
+        if key not in SWEEPABLE or side not in ("", "left", "right") or (side and key not in PER_SIDE):
+            raise SystemExit(f"cannot sweep {name!r}")
+        axes.append([(side, key, SWEEPABLE[key](v)) for v in values.split(",")])
+    configs = []
+    for combo in itertools.product(*axes):
+        params = {}
+        for side, key, value in combo:
+            if not side:
+                params[key] = value
+        for side, key, value in combo:
+            if side:
+                base = params.get(key, PER_SIDE[key])
+                pair = list(base) if isinstance(base, list) else [base, base]
+                pair[side == "right"] = value
+                params[key] = pair
+        configs.append(params)
+    return configs
+
+
+def config_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def play(job):
+    # Plays one chunk of AI-vs-AI matches as a single batch and summarises
+    # each match. Seeds depend only on the match index, so every config sees
+    # the same serves and spawns.
+    params, chunk, seeds, max_ticks, run = job
+    start = time.perf_counter()
+    sim = Simulation(len(seeds), seed=np.asarray(seeds, dtype=np.uint64), ai=(True, True),
+                     record_events=True, **params)
+    hits = np.zeros(sim.n, dtype=np.int64)
+    powerups = np.zeros(sim.n, dtype=np.int64)
+    while not sim.done.all() and sim.tick.max() < max_ticks:
+        sim.step()
+        for kind, n, _, _ in sim.events:
+            if kind == "hit":
+                hits[n] += 1
+            elif kind == "powerup":
+                powerups[n] += 1
+    matches = [{
+        "seed": int(seed), "winner": int(winner), "score": [int(s) for s in score], "ticks": int(ticks),
+        "hits": int(h), "powerups": int(p),
+    } for seed, winner, score, ticks, h, p in zip(seeds, sim.winner(), sim.score, sim.tick, hits, powerups)]
+    return {"config": config_key(params), "params": params, "chunk": chunk, "run": run,
+            "elapsed": time.perf_counter() - start, "matches": matches}
+
+
+def load_results(path):
+    # Every finished chunk is one JSON line. A half-written last line from an
+    # interrupted run is cut off, so the chunk is played again and the next
+    # result starts on a line of its own.
+    results = []
+    good = 0
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    results.append(json.loads(line))
+                except ValueError:
+                    break
+                good += len(line)
+        if good < os.path.getsize(path):
+            os.truncate(path, good)
+    return results
+
+
+def summarize(results):
+    by_config = {}
+    for result in results:
+        by_config.setdefault(result["config"], (result["params"], []))[1].extend(result["matches"])
+    rows = []
+    for params, matches in by_config.values():
+        winner = np.array([m["winner"] for m in matches])
+        ticks = np.array([m["ticks"] for m in matches])
+        points = np.array([sum(m["score"]) for m in matches])
+        hits = np.array([m["hits"] for m in matches])
+        powerups = np.array([m["powerups"] for m in matches])
+        finished = winner >= 0
+        with_pu = powerups > 0
+        rows.append({
+            "params": params,
+            "matches": len(matches),
+            "unfinished": int((~finished).sum()),
+            "left_win_rate": float((winner[finished] == 0).mean()) if finished.any() else 0.0,
+            "rally_hits": float(hits.sum() / max(1, points.sum())),
+            "duration_s": float(ticks.mean() / TICK_RATE),
+            "powerups_per_match": float(powerups.mean()),
+            # Power-up impact: how matches that saw a pickup differ from those that did not.
+            "duration_s_with_powerups": float(ticks[with_pu].mean() / TICK_RATE) if with_pu.any() else None,
+            "duration_s_without_powerups": float(ticks[~with_pu].mean() / TICK_RATE) if (~with_pu).any() else None,
+        })
+    return rows
+
+
+def print_report(rows):
+    print(f"{'config':48} {'n':>6} {'left win':>9} {'rally':>6} {'secs':>7} {'pu/m':>5} {'secs pu/no':>13}")
+    for row in rows:
+        name = " ".join(f"{k}={v}" for k, v in sorted(row["params"].items())) or "defaults"
+        split = "/".join("-" if v is None else f"{v:.0f}"
+                         for v in (row["duration_s_with_powerups"], row["duration_s_without_powerups"]))
+        print(f"{name[:48]:48} {row['matches']:6d} {row['left_win_rate']:9.1%} {row['rally_hits']:6.2f} "
+              f"{row['duration_s']:7.1f} {row['powerups_per_match']:5.2f} {split:>13}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play AI-vs-AI matches over a grid of parameters")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="parameter values to sweep (repeatable); prefix AI settings with left. or right.")
+    parser.add_argument("--matches", type=int, default=100, help="matches per configuration")
+    parser.add_argument("--chunk", type=int, default=50, help="matches per job")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS, help="give up on a match after this many ticks")
+    parser.add_argument("--output", default="sweep.jsonl", help="results file; rerun to resume")
+    parser.add_argument("--summary", help="also write the aggregated report as JSON")
+    args = parser.parse_args(argv)
+
+    configs = parse_grid(args.param)
+    # Chunks are only reusable by a run that would have played the same matches.
+    run = {"seed": args.seed, "matches": args.matches, "chunk": args.chunk, "max_ticks": args.max_ticks}
+    results = load_results(args.output)
+    if any(r.get("run") != run for r in results):
+        raise SystemExit(f"{args.output} holds results from other --seed/--matches/--chunk/--max-ticks "
+                         f"settings; pick another --output to start a new sweep")
+    done = {(r["config"], r["chunk"]) for r in results}
+    jobs = []
+    for params in configs:
+        for chunk, first in enumerate(range(0, args.matches, args.chunk)):
+            if (config_key(params), chunk) not in done:
+                seeds = list(range(args.seed + first, args.seed + min(first + args.chunk, args.matches)))
+                jobs.append((params, chunk, seeds, args.max_ticks, run))
+    total = len(configs) * -(-args.matches // args.chunk)
+    print(f"{len(configs)} configs, {total - len(jobs)}/{total} jobs already done, {args.workers} workers")
+
+    played = 0
+    start = time.perf_counter()
+    with open(args.output, "a") as out, mp.Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play, jobs):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            results.append(result)
+            played += len(result["matches"])
+    elapsed = time.perf_counter() - start
+
+    # The file may also hold configs from a wider grid; report only this one's.
+    wanted = {config_key(params) for params in configs}
+    rows = summarize([r for r in results if r["config"] in wanted])
+    print_report(rows)
+    if played:
+        rate = played / elapsed
+        print(f"{played} matches in {elapsed:.1f}s: {rate:.1f} matches/s, {rate / args.workers:.1f} per core")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())